@@ -0,0 +1,76 @@
+"""Представление моделей постов в виде словарей для JSON."""
+from posts.thumbnails import prefetch
+
+POST_FIELDS = (
+    'id', 'text', 'pub_date', 'author', 'group', 'image', 'thumbnail',
+    'comments_count',
+)
+COMMENT_FIELDS = ('id', 'text', 'created', 'author')
+
+
+class BadRequest(Exception):
+    """Ошибка в параметрах запроса; текст уходит клиенту с кодом 400."""
+
+
+def selected_fields(params, allowed):
+    """Поля из ``?fields=a,b``; без параметра — все ``allowed``."""
+    raw = params.get('fields')
+    if not raw:
+        return allowed
+    fields = tuple(name for name in raw.split(',') if name)
+    unknown = set(fields) - set(allowed)
+    if unknown:
+        raise BadRequest(
+            'Неизвестные поля: %s' % ', '.join(sorted(unknown)))
+    return fields
+
+
+def post_queryset(queryset, fields):
+    """Не грузить из базы то, что клиент не просил."""
+    if 'text' not in fields:
+        queryset = queryset.defer('text')
+    related = [name for name in ('author', 'group') if name in fields]
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset
+
+
+def post_data(post, fields):
+    data = {}
+    for name in fields:
+        if name == 'author':
+            data[name] = post.author.username
+        elif name == 'group':
+            data[name] = post.group.slug if post.group_id else None
+        elif name == 'image':
+            data[name] = post.image.url if post.image else None
+        elif name == 'thumbnail':
+            preview = getattr(post, 'previews', {}).get('card')
+            data[name] = preview.url if preview else None
+        else:
+            data[name] = getattr(post, name)
+    return data
+
+
+def posts_data(posts, fields):
+    if 'thumbnail' in fields:
+        prefetch(posts)
+    return [post_data(post, fields) for post in posts]
+
+
+def comment_data(comment, fields):
+    return {
+        name: (
+            comment.author.username if name == 'author'
+            else getattr(comment, name)
+        )
+        for name in fields
+    }
+
+
+def page_data(page, results):
+    return {
+        'results': results,
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    }
@@ -0,0 +1,105 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ApiViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='заголовок',
+            description='описание',
+            slug='api_group',
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Пост {i}', author=cls.author, group=cls.group)
+            for i in range(3)
+        ]
+        Comment.objects.create(
+            post=cls.posts[0], author=cls.reader, text='Комментарий')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def get_json(self, url, client=None, **params):
+        response = (client or self.client).get(url, params)
+        return response.status_code, json.loads(response.content)
+
+    @override_settings(POSTS_LIM=2)
+    def test_feed_cursor_pagination(self):
+        """Лента отдаётся страницами по курсору, от новых к старым."""
+        url = reverse('api:posts')
+        status, data = self.get_json(url)
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            [post['text'] for post in data['results']], ['Пост 2', 'Пост 1'])
+        self.assertIsNone(data['previous'])
+        _, data = self.get_json(url, after=data['next'])
+        self.assertEqual(
+            [post['text'] for post in data['results']], ['Пост 0'])
+        self.assertIsNone(data['next'])
+
+    def test_field_selection(self):
+        """Клиент получает только запрошенные поля."""
+        status, data = self.get_json(
+            reverse('api:group_posts', args=[self.group.slug]),
+            fields='id,author')
+        self.assertEqual(status, 200)
+        self.assertEqual(
+            data['results'][0], {'id': self.posts[2].pk, 'author': 'author'})
+        status, data = self.get_json(reverse('api:posts'), fields='secret')
+        self.assertEqual(status, 400)
+
+    def test_only_bad_params_answer_400(self):
+        """400 — только для ошибок в параметрах, сбой внутри
+        представления остаётся ошибкой сервера."""
+        status, data = self.get_json(reverse('api:posts'), limit='много')
+        self.assertEqual(status, 400)
+        self.assertEqual(data['detail'], 'limit должен быть числом')
+        with mock.patch('api.serializers.posts_data',
+                        side_effect=ValueError('внутренняя ошибка')):
+            with self.assertRaisesMessage(ValueError, 'внутренняя ошибка'):
+                self.client.get(reverse('api:posts'))
+
+    def test_compact_output(self):
+        """JSON без пробелов между элементами."""
+        response = self.client.get(
+            reverse('api:post_detail', args=[self.posts[0].pk]))
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn(b'", "', response.content)
+        self.assertIn('Пост 0'.encode(), response.content)
+
+    def test_post_comments_and_user(self):
+        """Комментарии поста и счётчики пользователя."""
+        _, data = self.get_json(
+            reverse('api:comments', args=[self.posts[0].pk]))
+        self.assertEqual(data['results'][0]['author'], 'reader')
+        self.assertEqual(data['results'][0]['text'], 'Комментарий')
+        _, data = self.get_json(reverse('api:user_detail', args=['author']))
+        self.assertEqual(data['posts_count'], 3)
+        status, _ = self.get_json(reverse('api:user_detail', args=['nobody']))
+        self.assertEqual(status, 404)
+
+    def test_follow_feed(self):
+        """Лента подписок только для вошедших."""
+        url = reverse('api:follow_posts')
+        status, _ = self.get_json(url)
+        self.assertEqual(status, 401)
+        Follow.objects.create(user=self.reader, author=self.author)
+        status, data = self.get_json(url, client=self.reader_client)
+        self.assertEqual(status, 200)
+        self.assertEqual(len(data['results']), 3)
@@ -0,0 +1,149 @@
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+
+from core.paginator import CursorPaginator
+from posts import counters
+from posts.caching import cached_page, conditional_page
+from posts.models import Group, Post
+from posts.views import (follow_page, follow_scopes, paginator,
+                         post_related_scopes)
+
+from . import serializers
+
+User = get_user_model()
+
+
+def respond(data, status=200):
+    """Компактный JSON без пробелов и с кириллицей как есть."""
+    return JsonResponse(
+        data, status=status,
+        json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False},
+    )
+
+
+def api_view(view):
+    """Только GET; ошибки отдаются JSON, а не HTML-страницами."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return respond({'detail': 'Метод не разрешён'}, status=405)
+        try:
+            return view(request, *args, **kwargs)
+        except Http404:
+            return respond({'detail': 'Не найдено'}, status=404)
+        except serializers.BadRequest as error:
+            return respond({'detail': str(error)}, status=400)
+    return wrapper
+
+
+def page_size(request):
+    try:
+        limit = int(request.GET.get('limit') or settings.POSTS_LIM)
+    except ValueError:
+        raise serializers.BadRequest('limit должен быть числом')
+    return max(1, min(limit, settings.API_MAX_LIMIT))
+
+
+def posts_page(request, post_list):
+    fields = serializers.selected_fields(
+        request.GET, serializers.POST_FIELDS)
+    page_obj = paginator(
+        request, serializers.post_queryset(post_list, fields),
+        per_page=page_size(request)
+    )
+    return respond(serializers.page_data(
+        page_obj, serializers.posts_data(page_obj, fields)))
+
+
+@api_view
+@cached_page('global')
+def posts(request):
+    return posts_page(request, Post.objects.all())
+
+
+@api_view
+@cached_page('group', kwarg='slug')
+def group_posts(request, slug):
+    group = get_object_or_404(Group, slug=slug)
+    return posts_page(request, group.posts.all())
+
+
+@api_view
+@cached_page('author', kwarg='username')
+def user_posts(request, username):
+    author = get_object_or_404(User, username=username)
+    return posts_page(request, author.posts.all())
+
+
+@api_view
+@cached_page('post', kwarg='post_id', related=post_related_scopes)
+def post_detail(request, post_id):
+    fields = serializers.selected_fields(
+        request.GET, serializers.POST_FIELDS)
+    post = get_object_or_404(
+        serializers.post_queryset(Post.objects.all(), fields), pk=post_id)
+    return respond(serializers.posts_data([post], fields)[0])
+
+
+@api_view
+@cached_page('post', kwarg='post_id')
+def comments(request, post_id):
+    fields = serializers.selected_fields(
+        request.GET, serializers.COMMENT_FIELDS)
+    post = get_object_or_404(
+        Post.objects.only('pk', 'comments_count'), pk=post_id)
+    comment_list = post.comments.all()
+    if 'text' not in fields:
+        comment_list = comment_list.defer('text')
+    if 'author' in fields:
+        comment_list = comment_list.select_related('author')
+    page_obj = CursorPaginator(
+        comment_list, page_size(request),
+        ordering=('created', 'pk'), count=post.comments_count,
+    ).get_page(
+        after=request.GET.get('after'), before=request.GET.get('before'))
+    return respond(serializers.page_data(page_obj, [
+        serializers.comment_data(comment, fields) for comment in page_obj
+    ]))
+
+
+@api_view
+@cached_page('global')
+def groups(request):
+    return respond({'results': list(
+        Group.objects.order_by('title').values('slug', 'title', 'description')
+    )})
+
+
+@api_view
+def user_detail(request, username):
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username)
+    author_counters = counters.of(author)
+    return respond({
+        'username': author.username,
+        'full_name': author.get_full_name(),
+        'posts_count': author_counters.posts_count,
+        'followers_count': author_counters.followers_count,
+        'following_count': author_counters.following_count,
+    })
+
+
+@api_view
+def follow_posts(request):
+    if not request.user.is_authenticated:
+        return respond({'detail': 'Нужна авторизация'}, status=401)
+    return follow_feed(request)
+
+
+@conditional_page(follow_scopes)
+def follow_feed(request):
+    fields = serializers.selected_fields(
+        request.GET, serializers.POST_FIELDS)
+    page_obj = follow_page(request, per_page=page_size(request))
+    return respond(serializers.page_data(
+        page_obj, serializers.posts_data(page_obj, fields)))
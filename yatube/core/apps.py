@@ -3,3 +3,18 @@ from django.apps import AppConfig
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from django.core import checks
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_delete, post_save
+
+        from . import sharding
+        from .db import apply_pragmas, check_connections
+        connection_created.connect(apply_pragmas)
+        request_started.connect(check_connections)
+        checks.register(sharding.check_shards)
+        for model in sharding.replicated_models():
+            post_save.connect(sharding.replicate, sender=model)
+            post_delete.connect(sharding.unreplicate, sender=model)
@@ -0,0 +1,19 @@
+"""SQLite, в котором пишущие транзакции могут начинаться с BEGIN IMMEDIATE.
+
+Обычный ``BEGIN`` откладывает блокировку до первой записи; если к этому
+моменту другой писатель уже держит её, повышение блокировки падает сразу,
+без ожидания ``busy_timeout``. ``BEGIN IMMEDIATE`` берёт блокировку
+записи в начале и ждёт её честно. Включается флагом ``begin_immediate``,
+его ставит ``core.transactions.write_transaction``.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.begin_immediate = False
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(
+            'BEGIN IMMEDIATE' if self.begin_immediate else 'BEGIN')
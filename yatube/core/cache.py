@@ -0,0 +1,35 @@
+"""Кэш-бэкенды, считающие попадания и промахи для метрик запроса.
+
+Для другого хранилища достаточно подмешать ``InstrumentedCacheMixin``
+к его классу так же, как к ``LocMemCache`` ниже.
+"""
+from django.core.cache.backends import locmem
+
+from core.instrumentation import cache_lookup
+
+MISSING = object()
+
+
+class InstrumentedCacheMixin:
+    def get(self, key, default=None, version=None):
+        with cache_lookup() as current:
+            value = super().get(key, MISSING, version=version)
+            if current is not None:
+                if value is MISSING:
+                    current.cache_misses += 1
+                else:
+                    current.cache_hits += 1
+        return default if value is MISSING else value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        with cache_lookup() as current:
+            found = super().get_many(keys, version=version)
+            if current is not None:
+                current.cache_hits += len(found)
+                current.cache_misses += len(keys) - len(found)
+        return found
+
+
+class LocMemCache(InstrumentedCacheMixin, locmem.LocMemCache):
+    pass
@@ -0,0 +1,46 @@
+"""Настройка соединений с базой: PRAGMA SQLite и проверка живости.
+
+``apply_pragmas`` выполняет ``settings.SQLITE_PRAGMAS`` на каждом новом
+соединении SQLite. WAL позволяет читателям не ждать писателя, а
+``busy_timeout`` заставляет писателя подождать освобождения блокировки
+вместо немедленного «database is locked».
+
+При ``CONN_MAX_AGE`` соединение переживает запрос; ``check_connections``
+перед запросом проверяет его через ``is_usable()`` бэкенда и закрывает
+сломанное, чтобы Django открыл новое (как ``CONN_HEALTH_CHECKS`` в
+новых версиях Django). Для SQLite проверка всегда успешна, она нужна
+базам, доступным по сети.
+"""
+from django.conf import settings
+from django.db import connections
+
+
+def pragma_statements(pragmas, in_memory=False):
+    # WAL и mmap для базы в памяти не имеют смысла.
+    skipped = {'journal_mode', 'mmap_size'} if in_memory else set()
+    return [
+        f'PRAGMA {name} = {value}'
+        for name, value in pragmas.items()
+        if name not in skipped
+    ]
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # Мимо курсора Django, как бэкенд включает foreign_keys: PRAGMA не
+    # должны попадать в счётчики запросов.
+    for statement in pragma_statements(
+            settings.SQLITE_PRAGMAS, connection.is_in_memory_db()):
+        connection.connection.execute(statement)
+
+
+def check_connections(**kwargs):
+    if not settings.DB_HEALTH_CHECKS:
+        return
+    for connection in connections.all():
+        if connection.connection is None or not connection.settings_dict[
+                'CONN_MAX_AGE']:
+            continue
+        if not connection.is_usable():
+            connection.close()
@@ -0,0 +1,104 @@
+"""Замеры одного запроса: число и время SQL, время рендера шаблонов,
+попадания в кэш.
+
+``probe()`` включает счётчики для текущего потока. Рендер шаблонов
+считается по самому внешнему ``Template.render``, поэтому вложенные
+``include`` не удваивают время; SQL, выполненный при рендере, входит и
+в ``sql_time``, и в ``render_time``. Попадания считает кэш-бэкенд из
+``core.cache``.
+"""
+import math
+import threading
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+
+from django.db import connections
+from django.template.base import Template
+
+_local = threading.local()
+_original_render = Template.render
+
+
+class Probe:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.depth = 0
+        self.cache_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += perf_counter() - start
+
+
+def percentile(values, share):
+    """Процентиль по ближайшему рангу."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(share * len(ordered)))
+    return ordered[rank - 1]
+
+
+def timed_render(self, context):
+    current = getattr(_local, 'probe', None)
+    if current is None:
+        return _original_render(self, context)
+    current.depth += 1
+    start = perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        current.depth -= 1
+        if not current.depth:
+            current.render_time += perf_counter() - start
+
+
+def install():
+    """Подменить ``Template.render`` замеряющей версией (один раз)."""
+    Template.render = timed_render
+
+
+@contextmanager
+def cache_lookup():
+    """Текущий замер для одного обращения к кэшу.
+
+    Внутри обращения отдаётся ``None``: локальный бэкенд реализует
+    ``get_many`` через ``get``, и ключи не должны считаться дважды.
+    """
+    current = getattr(_local, 'probe', None)
+    if current is None or current.cache_depth:
+        yield None
+        return
+    current.cache_depth += 1
+    try:
+        yield current
+    finally:
+        current.cache_depth -= 1
+
+
+@contextmanager
+def probe():
+    """Счётчики SQL и рендера на время блока в текущем потоке."""
+    install()
+    current = Probe()
+    previous = getattr(_local, 'probe', None)
+    _local.probe = current
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(current))
+            yield current
+    finally:
+        _local.probe = previous
+        if previous is not None:
+            # SQL вложенного замера уже учтён обёрткой внешнего.
+            if not previous.depth:
+                previous.render_time += current.render_time
+            previous.cache_hits += current.cache_hits
+            previous.cache_misses += current.cache_misses
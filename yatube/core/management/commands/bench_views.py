@@ -0,0 +1,255 @@
+import json
+import sqlite3
+from collections import namedtuple
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from core.instrumentation import percentile, probe
+from posts.models import Comment, Counters, Group, Post
+
+User = get_user_model()
+
+Case = namedtuple('Case', 'name method url data user')
+
+# Не из INTERNAL_IPS, чтобы не мерить debug_toolbar.
+REMOTE_ADDR = '192.0.2.1'
+
+
+def cases(author, reader, group, post):
+    """Все представления posts и users с аргументами из базы."""
+    uid = urlsafe_base64_encode(force_bytes(reader.pk))
+    token = default_token_generator.make_token(reader)
+    new_post = {'text': 'Замер', 'group': group.pk}
+    return [
+        Case('posts:index', 'get', reverse('posts:index'), None, None),
+        Case('posts:index [user]', 'get', reverse('posts:index'), None,
+             reader),
+        Case('posts:group_list', 'get',
+             reverse('posts:group_list', args=[group.slug]), None, None),
+        Case('posts:profile', 'get',
+             reverse('posts:profile', args=[author.username]), None, reader),
+        Case('posts:post_detail', 'get',
+             reverse('posts:post_detail', args=[post.pk]), None, None),
+        Case('posts:post_detail [user]', 'get',
+             reverse('posts:post_detail', args=[post.pk]), None, reader),
+        Case('posts:post_comments', 'get',
+             reverse('posts:post_comments', args=[post.pk]), None, None),
+        Case('posts:follow_index', 'get', reverse('posts:follow_index'),
+             None, reader),
+        Case('posts:post_create', 'get', reverse('posts:post_create'), None,
+             author),
+        Case('posts:post_create [POST]', 'post',
+             reverse('posts:post_create'), new_post, author),
+        Case('posts:post_edit', 'get',
+             reverse('posts:post_edit', args=[post.pk]), None, post.author),
+        Case('posts:post_edit [POST]', 'post',
+             reverse('posts:post_edit', args=[post.pk]),
+             {'text': post.text, 'group': post.group_id or ''}, post.author),
+        Case('posts:add_comment [POST]', 'post',
+             reverse('posts:add_comment', args=[post.pk]),
+             {'text': 'Замер'}, reader),
+        Case('posts:profile_follow', 'get',
+             reverse('posts:profile_follow', args=[author.username]), None,
+             reader),
+        Case('posts:profile_unfollow', 'get',
+             reverse('posts:profile_unfollow', args=[author.username]), None,
+             reader),
+        Case('users:signup', 'get', reverse('users:signup'), None, None),
+        Case('users:login', 'get', reverse('users:login'), None, None),
+        Case('users:logout', 'get', reverse('users:logout'), None, None),
+        Case('users:password_change_form', 'get',
+             reverse('users:password_change_form'), None, reader),
+        Case('users:password_change_done', 'get',
+             reverse('users:password_change_done'), None, reader),
+        Case('users:password_reset_form', 'get',
+             reverse('users:password_reset_form'), None, None),
+        Case('users:password_reset_done', 'get',
+             reverse('users:password_reset_done'), None, None),
+        Case('users:password_reset_confirm', 'get',
+             reverse('users:password_reset_confirm', args=[uid, token]),
+             None, None),
+        Case('users:password_reset_complete', 'get',
+             reverse('users:password_reset_complete'), None, None),
+    ]
+
+
+def regressions(results, baseline, threshold):
+    """Строки о представлениях, ставших медленнее или болтливее базы."""
+    found = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['queries'] > before['queries']:
+            found.append(
+                f'{name}: запросов {before["queries"]} -> '
+                f'{result["queries"]}'
+            )
+        if result['p50_ms'] > before['p50_ms'] * (1 + threshold):
+            found.append(
+                f'{name}: p50 {before["p50_ms"]} -> {result["p50_ms"]} мс')
+    return found
+
+
+class Snapshot:
+    """Копии баз SQLite в памяти.
+
+    Пишущие представления должны пройти настоящий BEGIN IMMEDIATE и
+    COMMIT с ``on_commit``, поэтому их записи не откатываются
+    транзакцией, а затираются копией базы до замера.
+    """
+
+    def __init__(self):
+        aliases = dict.fromkeys([DEFAULT_DB_ALIAS, *settings.SHARD_DATABASES])
+        self.copies = {}
+        for alias in aliases:
+            connection = connections[alias]
+            if connection.vendor != 'sqlite':
+                raise CommandError(f'{alias}: замер умеет откатывать '
+                                   f'только SQLite')
+            if connection.in_atomic_block:
+                raise CommandError('Замер нельзя запускать в транзакции')
+            copy = sqlite3.connect(':memory:')
+            self.raw(alias).backup(copy)
+            self.copies[alias] = copy
+
+    def raw(self, alias):
+        connections[alias].ensure_connection()
+        return connections[alias].connection
+
+    def changes(self):
+        """Строк изменено соединениями; смена значения — была запись."""
+        return [self.raw(alias).total_changes for alias in self.copies]
+
+    def restore(self):
+        for alias, copy in self.copies.items():
+            copy.backup(self.raw(alias))
+        # Поколения и страницы в кэше описывают уже стёртые записи.
+        cache.clear()
+
+    def close(self):
+        for copy in self.copies.values():
+            copy.close()
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время, число и время SQL и рендер шаблонов каждого '
+            'представления на текущей базе (заполните её manage.py seed).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help='Не очищать кэш перед запросами: мерить попадания.'
+        )
+        parser.add_argument(
+            '--output', default='bench_views.json',
+            help='Куда записать результаты в JSON.'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON прошлого прогона для сравнения.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p50 относительно базы, доля.'
+        )
+
+    def handle(self, *args, **options):
+        author, reader, group, post = self.samples()
+        results = {}
+        snapshot = Snapshot()
+        try:
+            for case in cases(author, reader, group, post):
+                changes = snapshot.changes()
+                results[case.name] = self.measure(case, options)
+                self.report(case.name, results[case.name])
+                if snapshot.changes() != changes:
+                    snapshot.restore()
+        finally:
+            snapshot.close()
+        with open(options['output'], 'w', encoding='utf-8') as output:
+            json.dump({
+                'created': timezone.now().isoformat(),
+                'dataset': {
+                    'posts': Post.objects.count(),
+                    'comments': Comment.objects.count(),
+                    'users': User.objects.count(),
+                },
+                'warm_cache': options['warm_cache'],
+                'views': results,
+            }, output, ensure_ascii=False, indent=2, sort_keys=True)
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as baseline:
+                before = json.load(baseline)['views']
+            found = regressions(results, before, options['threshold'])
+            if found:
+                raise CommandError(
+                    'Регрессии относительно базы:\n' + '\n'.join(found))
+            self.stdout.write('Регрессий относительно базы нет')
+
+    def samples(self):
+        """Самый активный автор, самый подписанный читатель, горячие
+        группа и пост."""
+        post = Post.objects.select_related('author').order_by(
+            '-comments_count', '-pk').first()
+        group = Group.objects.annotate(
+            total=Count('posts')).order_by('-total').first()
+        if post is None or group is None:
+            raise CommandError('База пуста: сначала выполните manage.py seed')
+        counters = Counters.objects.select_related('user')
+        author = counters.order_by('-posts_count').first().user
+        reader = counters.exclude(user=author).order_by(
+            '-following_count').first()
+        return author, reader.user if reader else author, group, post
+
+    def measure(self, case, options):
+        client = Client(REMOTE_ADDR=REMOTE_ADDR)
+        if case.user is not None:
+            client.force_login(case.user)
+        timings, queries, sql, render = [], [], [], []
+        status = None
+        for attempt in range(options['warmup'] + options['repeat']):
+            if not options['warm_cache']:
+                cache.clear()
+            with probe() as current:
+                start = perf_counter()
+                response = getattr(client, case.method)(case.url, case.data)
+                elapsed = perf_counter() - start
+            status = response.status_code
+            if attempt < options['warmup']:
+                continue
+            timings.append(elapsed * 1000)
+            queries.append(current.queries)
+            sql.append(current.sql_time * 1000)
+            render.append(current.render_time * 1000)
+        return {
+            'status': status,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p90_ms': round(percentile(timings, 0.9), 2),
+            'p99_ms': round(percentile(timings, 0.99), 2),
+            'queries': max(queries),
+            'sql_ms': round(sum(sql) / len(sql), 2),
+            'render_ms': round(sum(render) / len(render), 2),
+        }
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:<34} {result["status"]} '
+            f'p50 {result["p50_ms"]:>8} мс  p99 {result["p99_ms"]:>8} мс  '
+            f'SQL {result["queries"]:>3} / {result["sql_ms"]:>7} мс  '
+            f'рендер {result["render_ms"]:>7} мс'
+        )
@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = ('Печатает токен для заголовка X-Profile: запрос с ним будет '
+            'профилирован.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
+        self.stderr.write(
+            f'Действует {settings.PROFILE_TOKEN_MAX_AGE} с; профили '
+            f'пишутся в {settings.PROFILE_DIR}'
+        )
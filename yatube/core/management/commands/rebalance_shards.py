@@ -0,0 +1,140 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from core import sharding
+
+
+def roots():
+    """Модели, шард которых задаёт сам ключ, а не строка-владелец."""
+    return [
+        model for model in sharding.sharded_models()
+        if not sharding.is_sharded(sharding.shard_field(model).related_model)
+    ]
+
+
+def dependents(model):
+    return [
+        other for other in sharding.sharded_models()
+        if sharding.shard_field(other).related_model is model
+    ]
+
+
+def stale_relations(model):
+    """Ссылки на ``model`` из нешардированных таблиц: после переезда
+    строки они указывали бы в пустоту."""
+    return [
+        relation for relation in model._meta.related_objects
+        if not sharding.is_sharded(relation.related_model)
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Раскладывает посты, комментарии и подписки по шардам из '
+            'SHARD_DATABASES и копирует на шарды пользователей и группы. '
+            'Повторный запуск безопасен.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать строки не на своём шарде.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('SHARD_DATABASES пуст: раскладывать некуда.')
+        self.batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        if not dry_run:
+            for model in sharding.replicated_models():
+                self.copy_replicated(model)
+        sources = list(dict.fromkeys(
+            [*settings.SHARD_DATABASES, DEFAULT_DB_ALIAS]))
+        for model in roots():
+            for source in sources:
+                for target, count in self.move(
+                        model, source, dry_run).items():
+                    self.stdout.write(
+                        f'{model._meta.label}: {source} -> {target} '
+                        f'{count}')
+        if not dry_run:
+            for model in sharding.sharded_models():
+                sharding.sync_sequence(model)
+
+    def batches(self, items):
+        for start in range(0, len(items), self.batch_size):
+            yield items[start:start + self.batch_size]
+
+    def copy_replicated(self, model):
+        """Довести копии ``model`` на шардах до строк ``default``."""
+        manager = model._base_manager
+        fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        objs = list(manager.using(DEFAULT_DB_ALIAS).order_by('pk'))
+        for alias in sharding.other_shards():
+            for batch in self.batches(objs):
+                existing = set(manager.using(alias).filter(
+                    pk__in=[obj.pk for obj in batch]).values_list(
+                    'pk', flat=True))
+                manager.using(alias).bulk_create(
+                    [obj for obj in batch if obj.pk not in existing])
+                manager.using(alias).bulk_update(
+                    [obj for obj in batch if obj.pk in existing], fields)
+            self.stdout.write(
+                f'{model._meta.label}: {len(objs)} копий на {alias}')
+
+    def move(self, model, source, dry_run):
+        """Перенести строки ``model`` из ``source`` на их шарды."""
+        key = sharding.shard_field(model).attname
+        misplaced = {}
+        rows = model._base_manager.using(source).values_list('pk', key)
+        for pk, value in rows.iterator():
+            target = sharding.shard_for(value)
+            if target != source:
+                misplaced.setdefault(target, []).append(pk)
+        moved = Counter()
+        for target, pks in misplaced.items():
+            for batch in self.batches(pks):
+                if not dry_run:
+                    self.move_rows(model, batch, source, target)
+                moved[target] += len(batch)
+        return moved
+
+    def collect(self, model, pks, source):
+        """Строки ``model`` и всех, кто живёт в шарде вместе с ними."""
+        collected = [(model, list(
+            model._base_manager.using(source).filter(pk__in=pks)))]
+        for dependent in dependents(model):
+            field = sharding.shard_field(dependent)
+            dependent_pks = list(dependent._base_manager.using(
+                source).filter(**{f'{field.name}__in': pks}).values_list(
+                'pk', flat=True))
+            if dependent_pks:
+                collected += self.collect(dependent, dependent_pks, source)
+        return collected
+
+    def move_rows(self, model, pks, source, target):
+        collected = self.collect(model, pks, source)
+        # Сначала фиксируется копия, потом удаление: сбой между ними
+        # оставит дубли, которые повторный запуск пропустит.
+        with transaction.atomic(using=source):
+            with transaction.atomic(using=target):
+                for related, objs in collected:
+                    related._base_manager.using(target).bulk_create(
+                        objs, ignore_conflicts=True)
+            for related, objs in reversed(collected):
+                moved = [obj.pk for obj in objs]
+                for relation in stale_relations(related):
+                    relation.related_model._base_manager.using(
+                        source).filter(**{
+                            f'{relation.field.name}__in': moved
+                        })._raw_delete(source)
+                # Без сигналов: строки переезжают, а не удаляются, и
+                # счётчики с кэшем страниц не меняются.
+                related._base_manager.using(source).filter(
+                    pk__in=moved)._raw_delete(source)
@@ -0,0 +1,323 @@
+import http.client
+import json
+import logging
+import random
+import secrets
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import (BACKEND_SESSION_KEY, HASH_SESSION_KEY,
+                                 SESSION_KEY, get_user_model)
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.urls import reverse
+
+from core.instrumentation import percentile
+from core.management.commands.bench_views import REMOTE_ADDR
+from posts.models import Group, Post
+
+User = get_user_model()
+
+DEFAULT_MIX = 'feed=80,detail=10,comment=5,follow=5'
+
+Sample = namedtuple('Sample', 'at action latency status error')
+
+
+def parse_mix(value):
+    """``'feed=80,detail=10'`` -> ``{'feed': 80.0, 'detail': 10.0}``."""
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ACTIONS:
+            raise CommandError(
+                f'Неизвестное действие {name!r}; есть: {", ".join(ACTIONS)}')
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise CommandError(f'Вес действия {name!r} должен быть числом')
+    if not sum(mix.values()) > 0:
+        raise CommandError('Сумма весов должна быть больше нуля')
+    return mix
+
+
+def summarize(samples):
+    """Пропускная способность, хвосты задержек и ошибки по выборке."""
+    latencies = [sample.latency * 1000 for sample in samples]
+    if not latencies:
+        return {'requests': 0}
+    span = max(sample.at for sample in samples) - min(
+        sample.at for sample in samples)
+    errors = Counter(sample.error for sample in samples if sample.error)
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / span, 1) if span else None,
+        'p50_ms': round(percentile(latencies, 0.5), 1),
+        'p99_ms': round(percentile(latencies, 0.99), 1),
+        'max_ms': round(max(latencies), 1),
+        'error_rate': round(sum(errors.values()) / len(samples), 4),
+        'errors': dict(errors),
+    }
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+LOCK_LOGGERS = ('django.request', 'core.transactions')
+
+
+def classify(status, retry_after):
+    """Ошибка ответа для выборки; ``'locked'`` — 503 с ``Retry-After``,
+    которым ``core.transactions`` отвечает на занятую базу."""
+    if status < 500:
+        return None
+    if status == 503 and retry_after is not None:
+        return 'locked'
+    return f'http {status}'
+
+
+class LockErrors(logging.Handler):
+    """Считает отказы из-за блокировки SQLite по логам сервера: 503
+    из ``core.transactions`` и 500-е, упавшие на «database is locked»."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        if record.name == 'core.transactions' or (
+                record.exc_info and 'locked' in str(record.exc_info[1])):
+            self.count += 1
+
+
+class VirtualUser:
+    """Залогиненный клиент со своей сессией и CSRF-токеном."""
+
+    def __init__(self, user, host, port):
+        self.user = user
+        self.host = host
+        self.port = port
+        self.csrf = secrets.token_hex(16)
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        self.cookie = (
+            f'{settings.SESSION_COOKIE_NAME}={session.session_key}; '
+            f'{settings.CSRF_COOKIE_NAME}={self.csrf}'
+        )
+
+    def request(self, method, path, data=None):
+        connection = http.client.HTTPConnection(
+            self.host, self.port, timeout=60)
+        headers = {'Cookie': self.cookie}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers.update({
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'X-CSRFToken': self.csrf,
+            })
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            return response.status, response.getheader('Retry-After')
+        finally:
+            connection.close()
+
+
+def feed(client, data, rng):
+    choice = rng.random()
+    page = {'page': rng.randint(1, 3)}
+    if choice < 0.5:
+        path = reverse('posts:index')
+    elif choice < 0.8:
+        path = reverse('posts:group_list', args=[rng.choice(data['groups'])])
+    else:
+        path = reverse('posts:follow_index')
+    return client.request('GET', f'{path}?{urlencode(page)}')
+
+
+def detail(client, data, rng):
+    return client.request(
+        'GET', reverse('posts:post_detail', args=[rng.choice(data['posts'])]))
+
+
+def comment(client, data, rng):
+    return client.request(
+        'POST', reverse('posts:add_comment', args=[rng.choice(data['posts'])]),
+        {'text': 'Нагрузочный комментарий'},
+    )
+
+
+def follow(client, data, rng):
+    view = rng.choice(('posts:profile_follow', 'posts:profile_unfollow'))
+    return client.request(
+        'GET', reverse(view, args=[rng.choice(data['authors'])]))
+
+
+ACTIONS = {
+    'feed': feed,
+    'detail': detail,
+    'comment': comment,
+    'follow': follow,
+}
+
+
+class Command(BaseCommand):
+    help = ('Смешанная нагрузка читателей и писателей на WSGI-сервер '
+            'проекта. Пишет в текущую базу: запускайте на копии.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mix', default=DEFAULT_MIX,
+            help=f'Доли действий, по умолчанию {DEFAULT_MIX}.'
+        )
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--duration', type=float, default=60,
+            help='Длительность, секунды.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5,
+            help='Шаг отчёта во времени, секунды.'
+        )
+        parser.add_argument(
+            '--url',
+            help='Внешний сервер, например http://127.0.0.1:8000; '
+                 'по умолчанию поднимается свой из yatube.wsgi.'
+        )
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='JSON с итогами и рядами.')
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options['mix'])
+        data = self.sample_data(options['users'])
+        lock_errors = LockErrors()
+        server = None
+        if options['url']:
+            target = urlsplit(options['url'])
+            host, port = target.hostname, target.port or 80
+        else:
+            server, host, port = self.start_server()
+            for name in LOCK_LOGGERS:
+                logging.getLogger(name).addHandler(lock_errors)
+        clients = [VirtualUser(user, host, port) for user in data['users']]
+        samples = []
+        lock = threading.Lock()
+        started = time.monotonic()
+        deadline = started + options['duration']
+
+        def worker(number):
+            rng = random.Random(options['seed'] * 1000 + number)
+            names, weights = list(mix), list(mix.values())
+            while time.monotonic() < deadline:
+                action = rng.choices(names, weights)[0]
+                client = rng.choice(clients)
+                start = time.monotonic()
+                error = None
+                try:
+                    status, retry_after = ACTIONS[action](client, data, rng)
+                    error = classify(status, retry_after)
+                except OSError as exc:
+                    status, error = None, type(exc).__name__
+                sample = Sample(
+                    start - started, action, time.monotonic() - start,
+                    status, error,
+                )
+                with lock:
+                    samples.append(sample)
+
+        try:
+            with ThreadPoolExecutor(options['concurrency']) as pool:
+                list(pool.map(worker, range(options['concurrency'])))
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+                for name in LOCK_LOGGERS:
+                    logging.getLogger(name).removeHandler(lock_errors)
+        if server is None:
+            # Логов внешнего сервера не видно: считаем его ответы 503.
+            lock_errors.count = sum(
+                sample.error == 'locked' for sample in samples)
+        self.report(samples, options, lock_errors.count)
+
+    def sample_data(self, users):
+        posts = list(Post.objects.order_by('-pub_date').values_list(
+            'pk', flat=True)[:1000])
+        groups = list(Group.objects.values_list('slug', flat=True)[:100])
+        readers = list(User.objects.order_by('?')[:users])
+        authors = list(User.objects.filter(
+            counters__followers_count__gt=0).order_by(
+            '-counters__followers_count').values_list(
+            'username', flat=True)[:200])
+        if not posts or not groups or not readers:
+            raise CommandError('База пуста: сначала выполните manage.py seed')
+        return {
+            'posts': posts,
+            'groups': groups,
+            'users': readers,
+            'authors': authors or [user.username for user in readers],
+        }
+
+    def start_server(self):
+        from yatube.wsgi import application
+
+        def external(environ, start_response):
+            # Клиенты с 127.0.0.1 попали бы под debug_toolbar.
+            environ['REMOTE_ADDR'] = REMOTE_ADDR
+            return application(environ, start_response)
+
+        server = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(external)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        host, port = server.server_address
+        return server, host, port
+
+    def report(self, samples, options, lock_errors):
+        step = options['interval']
+        series = defaultdict(list)
+        for sample in samples:
+            series[int(sample.at // step)].append(sample)
+        timeline = []
+        for index in sorted(series):
+            summary = summarize(series[index])
+            summary['rps'] = round(len(series[index]) / step, 1)
+            summary['from_s'] = index * step
+            timeline.append(summary)
+            self.stdout.write(
+                f'{index * step:>6.0f} с  {summary["rps"]:>7} rps  '
+                f'p50 {summary["p50_ms"]:>7} мс  p99 {summary["p99_ms"]:>7} '
+                f'мс  ошибки {summary["error_rate"]:.2%}'
+            )
+        by_action = {
+            action: summarize([s for s in samples if s.action == action])
+            for action in sorted({sample.action for sample in samples})
+        }
+        total = summarize(samples)
+        total['lock_errors'] = lock_errors
+        self.stdout.write(f'Итого: {json.dumps(total, ensure_ascii=False)}')
+        for action, summary in by_action.items():
+            self.stdout.write(
+                f'  {action}: {json.dumps(summary, ensure_ascii=False)}')
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({
+                    'options': {
+                        key: options[key] for key in (
+                            'mix', 'concurrency', 'duration', 'url')
+                    },
+                    'total': total,
+                    'actions': by_action,
+                    'timeline': timeline,
+                }, output, ensure_ascii=False, indent=2)
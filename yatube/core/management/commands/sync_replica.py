@@ -0,0 +1,71 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from posts import caching
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик через backup API: '
+            'читатели реплики видят либо старую, либо новую копию целиком. '
+            'После копии сбрасывает страницы, прочитанные с реплик.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*',
+            help='Куда копировать; по умолчанию файлы DATABASE_REPLICAS.'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Повторять каждые N секунд; 0 — скопировать один раз.'
+        )
+
+    def targets(self, paths):
+        if paths:
+            return paths
+        targets = []
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections[alias]
+            if replica.vendor != 'sqlite':
+                # Настоящую реплику синхронизирует сама СУБД.
+                self.stderr.write(f'{alias}: не SQLite, пропускаю')
+                continue
+            targets.append(replica.settings_dict['NAME'])
+        if not targets:
+            raise CommandError('Нет файлов реплик: задайте DATABASE_REPLICAS '
+                               'или пути в аргументах.')
+        return targets
+
+    def sync(self, source, path):
+        start = time.perf_counter()
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+        self.stdout.write(
+            f'{path}: {(time.perf_counter() - start) * 1000:.0f} мс')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Основная база не SQLite.')
+        targets = self.targets(options['paths'])
+        synced = None
+        while True:
+            primary.ensure_connection()
+            # data_version меняется только от чужих коммитов: без записей
+            # копировать и сбрасывать кэш страниц незачем.
+            version = primary.connection.execute(
+                'PRAGMA data_version').fetchone()[0]
+            if version != synced:
+                for path in targets:
+                    self.sync(primary.connection, path)
+                caching.bump_replica()
+                synced = version
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,198 @@
+"""Метрики запросов по представлениям в текстовом формате Prometheus.
+
+Счётчики живут в памяти процесса: при нескольких воркерах каждый
+отдаёт свои, и Prometheus складывает их по меткам экземпляра. Доля
+попаданий в кэш считается запросом
+``rate(yatube_cache_hits_total) / rate(yatube_cache_lookups_total)``.
+"""
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from core.instrumentation import probe
+
+UNRESOLVED = 'unresolved'
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def cumulative(self):
+        running = 0
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        for bound, count in zip(bounds, self.counts):
+            running += count
+            yield bound, running
+
+
+class ViewStats:
+    def __init__(self):
+        self.latency = Histogram(settings.METRICS_LATENCY_BUCKETS)
+        self.queries = Histogram(settings.METRICS_QUERY_BUCKETS)
+        self.statuses = {}
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.cache_hits = 0
+        self.cache_lookups = 0
+
+
+def label(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+class WriteStats:
+    def __init__(self):
+        self.transactions = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_seconds = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.writes = {}
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.writes = {}
+
+    def observe_write(self, name, retries, wait, failed):
+        """Учесть пишущую транзакцию: повторы и ожидание блокировки."""
+        with self.lock:
+            stats = self.writes.get(name)
+            if stats is None:
+                stats = self.writes[name] = WriteStats()
+            stats.transactions += 1
+            stats.retries += retries
+            stats.failures += failed
+            stats.wait_seconds += wait
+
+    def observe(self, view, status, latency, current):
+        status = f'{status // 100}xx'
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.latency.observe(latency)
+            stats.queries.observe(current.queries)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            stats.sql_seconds += current.sql_time
+            stats.render_seconds += current.render_time
+            stats.cache_hits += current.cache_hits
+            stats.cache_lookups += current.cache_hits + current.cache_misses
+
+    def render(self):
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = []
+            self._histogram(
+                lines, views, 'request_duration_seconds', 'latency',
+                'Время ответа представления.')
+            self._histogram(
+                lines, views, 'request_queries', 'queries',
+                'Число SQL-запросов на ответ.')
+            lines += [
+                '# HELP yatube_requests_total Ответы по классам статуса.',
+                '# TYPE yatube_requests_total counter',
+            ]
+            for view, stats in views:
+                for status, count in sorted(stats.statuses.items()):
+                    lines.append(
+                        f'yatube_requests_total{{view="{label(view)}",'
+                        f'status="{status}"}} {count}'
+                    )
+            for name, attribute, help_text in (
+                ('sql_seconds_total', 'sql_seconds', 'Время в SQL.'),
+                ('render_seconds_total', 'render_seconds',
+                 'Время рендера шаблонов.'),
+                ('cache_hits_total', 'cache_hits', 'Попадания в кэш.'),
+                ('cache_lookups_total', 'cache_lookups',
+                 'Обращения к кэшу за ключами.'),
+            ):
+                lines += [
+                    f'# HELP yatube_{name} {help_text}',
+                    f'# TYPE yatube_{name} counter',
+                ]
+                for view, stats in views:
+                    lines.append(
+                        f'yatube_{name}{{view="{label(view)}"}} '
+                        f'{getattr(stats, attribute)}'
+                    )
+            writes = sorted(self.writes.items())
+            for name, attribute, help_text in (
+                ('write_transactions_total', 'transactions',
+                 'Пишущие транзакции.'),
+                ('write_retries_total', 'retries',
+                 'Повторы из-за занятой базы.'),
+                ('write_failures_total', 'failures',
+                 'Транзакции, не дождавшиеся блокировки.'),
+                ('write_wait_seconds_total', 'wait_seconds',
+                 'Время до удачной попытки.'),
+            ):
+                lines += [
+                    f'# HELP yatube_{name} {help_text}',
+                    f'# TYPE yatube_{name} counter',
+                ]
+                for function, stats in writes:
+                    lines.append(
+                        f'yatube_{name}{{function="{label(function)}"}} '
+                        f'{getattr(stats, attribute)}'
+                    )
+        return '\n'.join(lines) + '\n'
+
+    def _histogram(self, lines, views, name, attribute, help_text):
+        lines += [
+            f'# HELP yatube_{name} {help_text}',
+            f'# TYPE yatube_{name} histogram',
+        ]
+        for view, stats in views:
+            histogram = getattr(stats, attribute)
+            view = label(view)
+            for bound, count in histogram.cumulative():
+                lines.append(
+                    f'yatube_{name}_bucket{{view="{view}",le="{bound}"}} '
+                    f'{count}'
+                )
+            lines += [
+                f'yatube_{name}_sum{{view="{view}"}} {histogram.sum}',
+                f'yatube_{name}_count{{view="{view}"}} {histogram.total}',
+            ]
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """Замеряет каждый запрос и относит его к имени представления."""
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = perf_counter()
+        with probe() as current:
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        registry.observe(
+            match.view_name if match else UNRESOLVED,
+            response.status_code, perf_counter() - start, current,
+        )
+        return response
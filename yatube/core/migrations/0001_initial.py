@@ -0,0 +1,21 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sequence',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='Таблица')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Последний выданный id')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+from django.db import models
+
+
+class Sequence(models.Model):
+    """Общая последовательность id для таблиц, разложенных по шардам."""
+
+    name = models.CharField(
+        verbose_name='Таблица',
+        max_length=100,
+        primary_key=True
+    )
+    value = models.BigIntegerField(
+        verbose_name='Последний выданный id',
+        default=0
+    )
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
@@ -0,0 +1,139 @@
+"""Поиск N+1 и превышений бюджета запросов в одном ответе.
+
+N+1 — один и тот же отпечаток SQL с разными параметрами не меньше
+``QUERY_AUDIT_REPEAT`` раз за ответ: обычно это обращение к связанному
+объекту в цикле. Бюджет — предел числа запросов представления,
+объявленный декоратором ``query_budget`` рядом с ним.
+
+``QUERY_AUDIT`` задаёт реакцию: ``'log'`` пишет в лог
+``core.nplusone``, ``'raise'`` бросает ``QueryAuditError`` (так делают
+тесты через ``QueryAuditMixin``), ``None`` выключает проверку.
+Запросы, отпечатки которых подходят под ``QUERY_AUDIT_ALLOWLIST`` или
+``allow`` представления, не проверяются и не входят в бюджет.
+"""
+import logging
+import re
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings
+
+from core.slow_queries import fingerprint, location
+
+logger = logging.getLogger(__name__)
+
+
+class QueryAuditError(AssertionError):
+    pass
+
+
+def query_budget(queries, allow=()):
+    """Объявить предел запросов представления и допустимые отпечатки.
+
+    Ставится внешним декоратором, чтобы атрибуты видел ``resolver_match``.
+    """
+    def decorator(view):
+        view.query_budget = queries
+        view.query_allow = tuple(allow)
+        return view
+    return decorator
+
+
+def freeze(params):
+    if isinstance(params, dict):
+        return tuple(sorted(params.items()))
+    return tuple(params) if params is not None else None
+
+
+class Auditor:
+    """Execute-обёртка: запросы ответа по отпечаткам и их параметрам."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        key = fingerprint(sql)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = [0, set(), location()]
+        group[0] += 1
+        if not many:
+            try:
+                group[1].add(freeze(params))
+            except TypeError:
+                group[1].add(repr(params))
+        return execute(sql, params, many, context)
+
+    def report(self, allow):
+        """Число запросов и группы ``(sql, вариантов, место)`` без
+        допустимых отпечатков."""
+        patterns = [re.compile(pattern) for pattern in allow]
+        total, groups = 0, []
+        for sql, (count, variants, where) in self.groups.items():
+            if any(pattern.search(sql) for pattern in patterns):
+                continue
+            total += count
+            groups.append((sql, len(variants), where))
+        return total, groups
+
+
+def problems(auditor, view, func):
+    allow = list(settings.QUERY_AUDIT_ALLOWLIST) + list(
+        getattr(func, 'query_allow', ()))
+    total, groups = auditor.report(allow)
+    found = [
+        f'N+1 в {view}: {count} раз'
+        f'{f" из шаблона {where}" if where else ""}: {sql}'
+        for sql, count, where in groups
+        if count >= settings.QUERY_AUDIT_REPEAT
+    ]
+    budget = getattr(func, 'query_budget', None)
+    if budget is not None and total > budget:
+        found.append(f'{view}: {total} запросов при бюджете {budget}')
+    return found
+
+
+class QueryAuditMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = settings.QUERY_AUDIT
+        if mode is None:
+            return self.get_response(request)
+        auditor = Auditor()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(auditor))
+            response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            return response
+        found = problems(auditor, match.view_name, match.func)
+        if found and mode == 'raise':
+            raise QueryAuditError('\n'.join(found))
+        for problem in found:
+            logger.warning(problem)
+        return response
+
+
+class QueryAuditMixin:
+    """Для ``TestCase``: N+1 и превышение бюджета валят тест."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._query_audit = override_settings(QUERY_AUDIT='raise')
+        cls._query_audit.enable()
+        try:
+            super().setUpClass()
+        except Exception:
+            cls._query_audit.disable()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            super().tearDownClass()
+        finally:
+            cls._query_audit.disable()
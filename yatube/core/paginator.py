@@ -0,0 +1,201 @@
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.http import Http404
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+def encode_key(values):
+    return urlsafe_base64_encode(
+        json.dumps(values, separators=(',', ':')).encode())
+
+
+def canonical_cursor(cursor):
+    """Курсор ``(дата, id)`` в каноническом виде или None, если это не
+    курсор ленты."""
+    try:
+        date, pk = json.loads(urlsafe_base64_decode(cursor).decode())
+        if parse_datetime(date) is None or type(pk) is not int:
+            return None
+    except (ValueError, TypeError):
+        return None
+    return encode_key([date, pk])
+
+
+def page_number(value):
+    """Номер страницы из запроса: мусор даёт первую страницу, номер
+    больше ``settings.PAGINATOR_MAX_PAGE`` — 404."""
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return 1
+    if number > settings.PAGINATOR_MAX_PAGE:
+        raise Http404('Страницы дальше %d листаются курсором'
+                      % settings.PAGINATOR_MAX_PAGE)
+    return max(1, number)
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (поле сортировки, pk) без COUNT(*) и OFFSET.
+
+    Страницы адресуются непрозрачными курсорами ``after``/``before``,
+    которые лежат в атрибутах ``next_cursor``/``previous_cursor``
+    обычного ``Page``. Номер страницы ``page`` поддерживается для
+    совместимости: он переводится в эквивалентный курсор, а номера
+    больше ``settings.PAGINATOR_MAX_PAGE`` дают 404.
+    Общее число страниц неизвестно, поэтому ``number`` и ``num_pages``
+    условные: их хватает лишь для ``has_next``/``has_previous``.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-pk'),
+                 count=None):
+        super().__init__(object_list, per_page)
+        self.ordering = tuple(ordering)
+        self.fields = tuple(name.lstrip('-') for name in self.ordering)
+        if count is not None:
+            self.count = count
+
+    def get_page(self, number=None, after=None, before=None):
+        """Вернуть страницу по курсору или номеру.
+
+        Испорченный ввод даёт первую страницу, слишком большой номер —
+        ``Http404``.
+        """
+        for cursor, backwards in ((after, False), (before, True)):
+            key = self.decode_cursor(cursor)
+            if key is not None:
+                return self.cursor_page(key, backwards=backwards)
+        return self.numbered_page(number)
+
+    def numbered_page(self, number):
+        number = page_number(number)
+        if number == 1:
+            return self.first_page()
+        offset = (number - 1) * self.per_page
+        boundary = self.object_list.order_by(
+            *self.ordering).values_list(*self.fields)[offset - 1:offset]
+        if not boundary:
+            return self.last_page()
+        page = self.cursor_page(tuple(boundary[0]))
+        return self._get_page(
+            page.object_list, number, self,
+            next_cursor=page.next_cursor,
+            previous_cursor=page.previous_cursor,
+        )
+
+    def first_page(self):
+        items = list(self.object_list.order_by(
+            *self.ordering)[:self.per_page + 1])
+        return self.build_page(items, number=1)
+
+    def last_page(self):
+        items = list(self.object_list.order_by(
+            *self._reversed_ordering())[:self.per_page + 1])
+        items.reverse()
+        has_previous = len(items) > self.per_page
+        items = items[-self.per_page:]
+        return self._get_page(
+            items, None, self,
+            previous_cursor=(
+                self.encode_cursor(self.key_of(items[0]))
+                if has_previous else None
+            ),
+        )
+
+    def cursor_page(self, key, backwards=False):
+        if not backwards:
+            items = list(self.object_list.filter(
+                self._seek(key)).order_by(
+                *self.ordering)[:self.per_page + 1])
+            return self.build_page(
+                items, number=None,
+                previous_cursor=(
+                    self.encode_cursor(self.key_of(items[0]))
+                    if items else None
+                ),
+            )
+        items = list(self.object_list.filter(
+            self._seek(key, backwards=True)).order_by(
+            *self._reversed_ordering())[:self.per_page + 1])
+        if len(items) <= self.per_page:
+            # Дошли до начала ленты: отдаём выровненную первую страницу.
+            return self.first_page()
+        items = items[:self.per_page]
+        items.reverse()
+        return self._get_page(
+            items, None, self,
+            next_cursor=self.encode_cursor(self.key_of(items[-1])),
+            previous_cursor=self.encode_cursor(self.key_of(items[0])),
+        )
+
+    def build_page(self, items, number=None, previous_cursor=None):
+        """Страница из уже выбранных (до per_page + 1) объектов."""
+        has_next = len(items) > self.per_page
+        items = items[:self.per_page]
+        return self._get_page(
+            items, number, self,
+            next_cursor=(
+                self.encode_cursor(self.key_of(items[-1]))
+                if has_next else None
+            ),
+            previous_cursor=previous_cursor,
+        )
+
+    def _get_page(self, object_list, number, paginator,
+                  next_cursor=None, previous_cursor=None):
+        if previous_cursor is None:
+            number = 1
+        elif number is None:
+            number = 2
+        self.num_pages = number + (next_cursor is not None)
+        page = Page(object_list, number, paginator)
+        page.next_cursor = next_cursor
+        page.previous_cursor = previous_cursor
+        return page
+
+    def _reversed_ordering(self):
+        return tuple(
+            name[1:] if name.startswith('-') else '-' + name
+            for name in self.ordering
+        )
+
+    def _seek(self, key, backwards=False):
+        """Условие «строго после ключа» в порядке сортировки."""
+        condition = Q()
+        equal = {}
+        for name, field, value in zip(self.ordering, self.fields, key):
+            descending = name.startswith('-') != backwards
+            lookup = '%s__%s' % (field, 'lt' if descending else 'gt')
+            condition |= Q(**equal, **{lookup: value})
+            equal[field] = value
+        return condition
+
+    def key_of(self, obj):
+        return tuple(getattr(obj, field) for field in self.fields)
+
+    def encode_cursor(self, key):
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in key
+        ]
+        return encode_key(values)
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        opts = self.object_list.model._meta
+        try:
+            values = json.loads(urlsafe_base64_decode(cursor).decode())
+            if len(values) != len(self.fields):
+                return None
+            return tuple(
+                (opts.pk if field == 'pk' else opts.get_field(field))
+                .to_python(value)
+                for field, value in zip(self.fields, values)
+            )
+        except (ValueError, TypeError, ValidationError):
+            return None
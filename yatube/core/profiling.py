@@ -0,0 +1,89 @@
+"""Профилирование отдельных живых запросов.
+
+Запрос профилируется, если в нём есть заголовок ``X-Profile`` с
+подписанным токеном (``manage.py profile_token``) или он попал в
+выборку с долей ``PROFILE_SAMPLE_RATE``. Остальные запросы платят одну
+проверку заголовка и, при ненулевой доле, одно случайное число.
+
+cProfile охватывает представление, рендер шаблонов и внутренние
+middleware; результат пишется в ``PROFILE_DIR`` файлом ``.pstats``, в
+имени которого имя представления, число SQL-запросов и время.
+"""
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core import signing
+
+from core.instrumentation import probe
+
+SALT = 'core.profiling'
+TOKEN_VALUE = 'profile'
+
+# cProfile не умеет профилировать два потока одновременно.
+_busy = threading.Lock()
+
+
+def make_token():
+    return signing.TimestampSigner(salt=SALT).sign(TOKEN_VALUE)
+
+
+def valid_token(token):
+    try:
+        value = signing.TimestampSigner(salt=SALT).unsign(
+            token, max_age=settings.PROFILE_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return value == TOKEN_VALUE
+
+
+def profile_path(view, queries, elapsed):
+    name = re.sub(r'[^\w.-]+', '.', view)
+    stamp = time.strftime('%Y%m%d-%H%M%S')
+    return os.path.join(
+        settings.PROFILE_DIR,
+        f'{stamp}-{name}-{queries}q-{elapsed * 1000:.0f}ms-'
+        f'{os.getpid()}.{threading.get_ident()}.pstats',
+    )
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get('HTTP_X_PROFILE')
+        requested = token is not None and valid_token(token)
+        rate = settings.PROFILE_SAMPLE_RATE
+        if not requested and not (rate and random.random() < rate):
+            return self.get_response(request)
+        if not _busy.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self.profile(request, requested)
+        finally:
+            _busy.release()
+
+    def profile(self, request, requested):
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with probe() as current:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        match = getattr(request, 'resolver_match', None)
+        path = profile_path(
+            match.view_name if match else 'unresolved',
+            current.queries, time.perf_counter() - start,
+        )
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(path)
+        if requested:
+            response['X-Profile-File'] = os.path.basename(path)
+        return response
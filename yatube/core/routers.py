@@ -0,0 +1,110 @@
+"""Чтение с реплик, запись на основную базу.
+
+``ReplicaRouter`` отдаёт чтения безопасных запросов (лента, пост,
+профиль) одной из баз ``DATABASE_REPLICAS``, а все записи — ``default``.
+Реплики включает ``ReplicaMiddleware``: вне запроса (команды, shell) и
+внутри транзакции всё читается с основной базы.
+
+Реплика отстаёт, поэтому после записи middleware ставит cookie
+``REPLICA_PIN_COOKIE`` на ``REPLICA_PIN_SECONDS`` секунд: пока она жива,
+браузер автора читает с основной базы и видит свой пост или комментарий
+сразу после редиректа. Локально реплика — копия файла SQLite, которую
+обновляет ``manage.py sync_replica``; кэш страниц учитывает её
+поколение (см. ``posts.caching``).
+
+``ShardRouter`` стоит первым и отправляет строки шардированных моделей
+(см. ``core.sharding``) на шард автора; реплики обслуживают остальные
+таблицы.
+"""
+import random
+import threading
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core import sharding
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_local = threading.local()
+
+
+def excluded(model):
+    return model._meta.app_label in settings.REPLICA_EXCLUDED_APPS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not getattr(_local, 'replicas', False) or excluded(model):
+            return None
+        # В транзакции читаем то, что сами только что записали.
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return _local.replica
+
+    def db_for_write(self, model, **hints):
+        if not excluded(model):
+            # Остаток запроса читает уже с основной базы.
+            _local.replicas = False
+            _local.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # На репликах те же строки, что и на основной базе.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ShardRouter:
+    def db_for_read(self, model, **hints):
+        return sharding.shard_of(model, hints)
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if (isinstance(instance, model) and sharding.enabled()
+                and sharding.is_sharded(model)):
+            return sharding.home(instance)
+        return sharding.shard_of(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding.enabled():
+            return None
+        # Копии пользователей и групп есть на каждом шарде, а сохранённые
+        # строки двух шардированных моделей связываются только в одном.
+        if all(sharding.is_sharded(type(obj)) and not obj._state.adding
+               for obj in (obj1, obj2)):
+            return obj1._state.db == obj2._state.db
+        return True
+
+
+class ReplicaMiddleware:
+    """Включает реплики для безопасных запросов без свежей записи."""
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _local.replicas = (
+            request.method in SAFE_METHODS
+            and settings.REPLICA_PIN_COOKIE not in request.COOKIES
+        )
+        # Одна реплика на запрос: у разных копий разное отставание.
+        _local.replica = random.choice(settings.DATABASE_REPLICAS)
+        _local.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = _local.wrote
+            _local.replicas = _local.wrote = False
+        if wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
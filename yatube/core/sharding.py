@@ -0,0 +1,466 @@
+"""Раскладка строк по шардам по id автора.
+
+Модель с атрибутом ``shard_by`` хранится в шардах
+``settings.SHARD_DATABASES``: ``shard_by`` — внешний ключ, по которому
+выбирается шард. Если он ведёт на обычную модель (автор), шард — это
+``shard_for(id)``; если на шардированную (пост), строка живёт рядом с
+ней. Пустой ``SHARD_DATABASES`` выключает всё: запросы идут в
+``default`` как обычно.
+
+Запрос, шард которого не виден из условий (``author=...``) или из
+связанного объекта (``author.posts``), ``ShardedQuerySet`` выполняет на
+всех шардах и сливает отсортированные части через heap по порядку
+запроса, например ``(pub_date, id)`` ленты. Срез ``[a:b]`` на каждом
+шарде превращается в ``[:b]``, смещение применяется после слияния.
+
+Модели из ``settings.SHARD_REPLICATED_MODELS`` (пользователи, группы)
+копируются на все шарды, чтобы на них работали JOIN. Id шардированных
+строк выдаёт общая ``Sequence`` в ``default`` блоками по
+``SHARD_ID_BLOCK``, поэтому строка сохраняет id при переезде на другой
+шард (``manage.py rebalance_shards``).
+"""
+import heapq
+import threading
+from collections import Counter
+from itertools import islice
+
+from django.apps import apps
+from django.conf import settings
+from django.core import checks
+from django.db import DEFAULT_DB_ALIAS, models, transaction
+from django.db.models import F, Max, Min, Sum
+from django.db.models.query import (FlatValuesListIterable, ModelIterable,
+                                    ValuesIterable)
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def enabled():
+    return bool(settings.SHARD_DATABASES)
+
+
+def shard_for(key):
+    shards = settings.SHARD_DATABASES
+    return shards[int(key) % len(shards)]
+
+
+def is_sharded(model):
+    return getattr(model, 'shard_by', None) is not None
+
+
+def sharded_models():
+    return [model for model in apps.get_models() if is_sharded(model)]
+
+
+def shard_field(model):
+    return model._meta.get_field(model.shard_by)
+
+
+def home(instance):
+    """Шард, где должен жить объект, по его ключу шардирования."""
+    field = shard_field(instance)
+    if is_sharded(field.related_model):
+        owner = getattr(instance, field.name)
+        return owner._state.db or home(owner)
+    return shard_for(getattr(instance, field.attname))
+
+
+def shard_of(model, hints):
+    """Шард запроса к ``model`` по связанному объекту или ``None``."""
+    if not enabled() or not is_sharded(model):
+        return None
+    instance = hints.get('instance')
+    if instance is None:
+        return None
+    if is_sharded(type(instance)):
+        return instance._state.db
+    field = shard_field(model)
+    owners = [
+        other for other in model._meta.concrete_fields
+        if other.is_relation and other.related_model is type(instance)
+    ]
+    # Подписка связана с пользователем дважды: по hint не понять, какой
+    # из ключей фильтруется.
+    if owners == [field]:
+        return shard_for(instance.pk)
+    return None
+
+
+def shards_of_lookups(model, lookups):
+    """Шарды, которыми ограничивают запрос условия ``filter``."""
+    field = shard_field(model)
+    names = {field.name, field.attname}
+    single = {
+        f'{name}{suffix}' for name in names
+        for suffix in ('', '__exact', '__pk', '__id')
+    }
+    many = {f'{name}__in' for name in names}
+    values = []
+    for lookup, value in lookups.items():
+        if lookup in single:
+            values.append(value)
+        elif lookup in many:
+            values.extend(value)
+    if not values and not any(lookup in many for lookup in lookups):
+        return None
+    if is_sharded(field.related_model):
+        found = {getattr(getattr(value, '_state', None), 'db', None)
+                 for value in values}
+        return None if None in found else found
+    return {
+        shard_for(value.pk if isinstance(value, models.Model) else value)
+        for value in values
+    }
+
+
+def next_id(model):
+    """Id новой строки из блока, взятого у общей последовательности."""
+    name = model._meta.db_table
+    with _blocks_lock:
+        last, end = _blocks.get(name, (0, 0))
+        if last >= end:
+            end = reserve(model, settings.SHARD_ID_BLOCK)
+            last = end - settings.SHARD_ID_BLOCK
+        _blocks[name] = (last + 1, end)
+        return last + 1
+
+
+def reserve(model, count):
+    """Забрать ``count`` id; вернуть последний из них."""
+    from core.models import Sequence
+    name = model._meta.db_table
+    sequences = Sequence.objects.using(DEFAULT_DB_ALIAS)
+    with transaction.atomic(using=DEFAULT_DB_ALIAS):
+        if not sequences.filter(name=name).update(
+                value=F('value') + count):
+            sequences.create(name=name, value=max_id(model) + count)
+        return sequences.values_list('value', flat=True).get(name=name)
+
+
+def max_id(model):
+    return model._default_manager.aggregate(last=Max('pk'))['last'] or 0
+
+
+def sync_sequence(model):
+    """Поднять последовательность выше id, вставленных в обход неё."""
+    from core.models import Sequence
+    last = max_id(model)
+    sequence, created = Sequence.objects.using(
+        DEFAULT_DB_ALIAS).get_or_create(
+        name=model._meta.db_table, defaults={'value': last})
+    if sequence.value < last:
+        sequence.value = last
+        sequence.save(update_fields=['value'])
+    with _blocks_lock:
+        _blocks.pop(model._meta.db_table, None)
+
+
+def other_shards():
+    return [
+        alias for alias in settings.SHARD_DATABASES
+        if alias != DEFAULT_DB_ALIAS
+    ]
+
+
+def replicated_values(instance):
+    return {
+        field.attname: getattr(instance, field.attname)
+        for field in instance._meta.concrete_fields
+    }
+
+
+def replicate(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Скопировать сохранённую в ``default`` строку на все шарды."""
+    if (raw or not enabled() or instance._state.db != DEFAULT_DB_ALIAS
+            or update_fields == frozenset({'last_login'})):
+        return
+    values = replicated_values(instance)
+    for alias in other_shards():
+        rows = sender._base_manager.using(alias)
+        if not rows.filter(pk=instance.pk).update(**values):
+            rows.bulk_create([sender(**values)])
+
+
+def unreplicate(sender, instance, **kwargs):
+    """Удалить копии строки; шардированные строки удалятся каскадом."""
+    if not enabled() or instance._state.db != DEFAULT_DB_ALIAS:
+        return
+    for alias in other_shards():
+        sender._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def replicated_models():
+    return [apps.get_model(label) for label in
+            settings.SHARD_REPLICATED_MODELS]
+
+
+def check_shards(app_configs, **kwargs):
+    return [
+        checks.Error(
+            f'Шард {alias} не описан в DATABASES.', id='core.E001')
+        for alias in settings.SHARD_DATABASES
+        if alias not in settings.DATABASES
+    ]
+
+
+def merge_parts(parts, key, descending):
+    """Слить отсортированные на шардах части в один порядок."""
+    return heapq.merge(*parts, key=key, reverse=descending)
+
+
+class ShardedQuerySet(models.QuerySet):
+    """QuerySet, который без известного шарда опрашивает все."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shards = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._shards = self._shards
+        return clone
+
+    def _filter_or_exclude(self, negate, *args, **kwargs):
+        clone = super()._filter_or_exclude(negate, *args, **kwargs)
+        if negate or clone._db is not None or not enabled():
+            return clone
+        shards = shards_of_lookups(self.model, kwargs)
+        if shards is None:
+            return clone
+        if self._shards is not None:
+            shards &= self._shards
+        if not shards:
+            return clone.none()
+        if len(shards) == 1:
+            return clone.using(shards.pop())
+        clone._shards = frozenset(shards)
+        return clone
+
+    def _scatters(self):
+        return (
+            self._db is None and enabled()
+            and shard_of(self.model, self._hints) is None
+        )
+
+    def _parts(self):
+        return [
+            self.using(alias)
+            for alias in settings.SHARD_DATABASES
+            if self._shards is None or alias in self._shards
+        ]
+
+    def _ordering(self):
+        query = self.query
+        if query.order_by:
+            return list(query.order_by)
+        if query.default_ordering:
+            return list(self.model._meta.ordering)
+        return []
+
+    def _gather(self):
+        """Выполнить запрос на шардах и слить результаты по порядку."""
+        low, high = self.query.low_mark, self.query.high_mark
+        ordering = self._ordering()
+        if any(not isinstance(name, str) or name == '?'
+               for name in ordering):
+            raise NotImplementedError(
+                'Сортировка выражением по нескольким шардам не '
+                'поддерживается.')
+        directions = {name.startswith('-') for name in ordering}
+        if len(directions) > 1:
+            raise NotImplementedError(
+                'Слияние шардов поддерживает только одно направление '
+                'сортировки.')
+        names = [name.lstrip('-') for name in ordering]
+        extra = self._missing_keys(names)
+        parts = []
+        for part in self._parts():
+            part.query.clear_limits()
+            if high is not None:
+                part.query.set_limits(high=high)
+            if extra:
+                part = self._with_keys(part, extra)
+            parts.append(list(part))
+        if names:
+            merged = merge_parts(
+                parts, self._key(names, extra), directions.pop())
+        else:
+            merged = (row for part in parts for row in part)
+        rows = list(islice(merged, low, high))
+        if extra:
+            rows = [self._strip_keys(row, len(extra)) for row in rows]
+        return rows
+
+    def _available(self):
+        """Имена полей в строках результата, не считая моделей."""
+        if self._fields:
+            return list(self._fields)
+        return [field.attname for field in self.model._meta.concrete_fields]
+
+    def _missing_keys(self, names):
+        if issubclass(self._iterable_class, ModelIterable):
+            return []
+        available = set(self._available())
+        pk = self.model._meta.pk.attname
+        return [
+            name for name in names
+            if name not in available
+            and not (name == 'pk' and pk in available)
+        ]
+
+    def _with_keys(self, part, extra):
+        fields = self._available()
+        if issubclass(self._iterable_class, ValuesIterable):
+            return part.values(*fields, *extra)
+        return part.values_list(*fields, *extra)
+
+    def _strip_keys(self, row, count):
+        if isinstance(row, dict):
+            return {key: row[key] for key in list(row)[:-count]}
+        row = row[:-count]
+        if self._iterable_class is FlatValuesListIterable:
+            return row[0]
+        return row
+
+    def _key(self, names, extra):
+        if issubclass(self._iterable_class, ModelIterable):
+            return lambda obj: tuple(
+                self._attribute(obj, name) for name in names)
+        columns = self._available() + extra
+        pk = self.model._meta.pk.attname
+        if issubclass(self._iterable_class, ValuesIterable):
+            keys = [
+                name if name in columns or name != 'pk' else pk
+                for name in names
+            ]
+            return lambda row: tuple(row[key] for key in keys)
+        positions = [
+            columns.index(name if name in columns or name != 'pk' else pk)
+            for name in names
+        ]
+        if not extra and self._iterable_class is FlatValuesListIterable:
+            return lambda value: (value,)
+        return lambda row: tuple(row[position] for position in positions)
+
+    @staticmethod
+    def _attribute(obj, name):
+        for part in name.split('__'):
+            obj = getattr(obj, part)
+        return obj
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._scatters():
+            self._result_cache = self._gather()
+        super()._fetch_all()
+
+    def iterator(self, chunk_size=2000):
+        if self._scatters():
+            return iter(self._gather())
+        return super().iterator(chunk_size)
+
+    def count(self):
+        if self._result_cache is not None or not self._scatters():
+            return super().count()
+        if self.query.low_mark or self.query.high_mark is not None:
+            return len(self)
+        return sum(part.count() for part in self._parts())
+
+    def exists(self):
+        if self._result_cache is not None or not self._scatters():
+            return super().exists()
+        return any(part.exists() for part in self._parts())
+
+    def aggregate(self, *args, **kwargs):
+        if not self._scatters():
+            return super().aggregate(*args, **kwargs)
+        for arg in args:
+            kwargs[arg.default_alias] = arg
+        combine = {}
+        for alias, expression in kwargs.items():
+            if getattr(expression, 'distinct', False):
+                raise NotImplementedError(
+                    'DISTINCT в агрегате по нескольким шардам не '
+                    'поддерживается.')
+            if isinstance(expression, (models.Count, Sum)):
+                combine[alias] = sum
+            elif isinstance(expression, (Max, Min)):
+                combine[alias] = max if isinstance(expression, Max) else min
+            else:
+                raise NotImplementedError(
+                    f'{type(expression).__name__} по нескольким шардам не '
+                    'поддерживается.')
+        results = [part.aggregate(**kwargs) for part in self._parts()]
+        totals = {}
+        for alias, function in combine.items():
+            values = [
+                result[alias] for result in results
+                if result[alias] is not None
+            ]
+            totals[alias] = function(values) if values else None
+        return totals
+
+    def update(self, **kwargs):
+        if not self._scatters():
+            return super().update(**kwargs)
+        return sum(part.update(**kwargs) for part in self._parts())
+
+    def delete(self):
+        if not self._scatters():
+            return super().delete()
+        total, per_model = 0, Counter()
+        for part in self._parts():
+            deleted, rows = part.delete()
+            total += deleted
+            per_model.update(rows)
+        return total, dict(per_model)
+
+    def create(self, **kwargs):
+        if not enabled():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        self._for_write = True
+        # Без using шард выберет роутер по самому объекту.
+        obj.save(force_insert=True, using=self._db)
+        return obj
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False):
+        if not enabled() or self._db is not None:
+            return super().bulk_create(
+                objs, batch_size=batch_size,
+                ignore_conflicts=ignore_conflicts)
+        objs = list(objs)
+        groups = {}
+        for obj in objs:
+            if obj.pk is None:
+                obj.pk = next_id(self.model)
+            groups.setdefault(home(obj), []).append(obj)
+        for alias, group in groups.items():
+            self.using(alias).bulk_create(
+                group, batch_size=batch_size,
+                ignore_conflicts=ignore_conflicts)
+        return objs
+
+
+ShardedManager = models.Manager.from_queryset(
+    ShardedQuerySet, 'ShardedManager')
+
+
+class ShardedModel(models.Model):
+    """Основа моделей, разложенных по шардам по полю ``shard_by``."""
+
+    shard_by = None
+
+    objects = ShardedManager()
+
+    class Meta:
+        abstract = True
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if self.pk is None and enabled():
+            self.pk = next_id(type(self))
+            force_insert = True
+        super().save(
+            force_insert=force_insert, force_update=force_update,
+            using=using, update_fields=update_fields)
@@ -0,0 +1,133 @@
+"""Журнал медленных запросов с привязкой к представлению и шаблону.
+
+Middleware собирает все SQL-запросы ответа, группирует их по отпечатку
+(текст без значений) и месту в шаблоне, откуда они пришли, и пишет в
+лог ``core.slow_queries`` группы, суммарное время которых не меньше
+``SLOW_QUERY_THRESHOLD`` секунд. Так видны и одиночные тяжёлые
+запросы, и сотня лёгких из ``{% for %}``.
+
+Место в шаблоне берётся из стека узлов, который ведёт подменённый
+``Node.render_annotated``.
+"""
+import logging
+import re
+import threading
+from contextlib import ExitStack
+from functools import lru_cache
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_original_render_annotated = Node.render_annotated
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+LIST_RE = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+SPACE_RE = re.compile(r'\s+')
+
+
+@lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """SQL без значений: одинаковый для запросов, отличающихся данными."""
+    sql = STRING_RE.sub('%s', sql)
+    sql = NUMBER_RE.sub('%s', sql)
+    sql = LIST_RE.sub('(...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def located_render(self, context):
+    nodes = getattr(_local, 'nodes', None)
+    if nodes is None:
+        return _original_render_annotated(self, context)
+    nodes.append(self)
+    try:
+        return _original_render_annotated(self, context)
+    finally:
+        nodes.pop()
+
+
+def location():
+    """``шаблон:строка`` узла, который сейчас рендерится, или ``None``."""
+    nodes = getattr(_local, 'nodes', None)
+    if not nodes:
+        return None
+    node = nodes[-1]
+    origin = getattr(node, 'origin', None)
+    token = getattr(node, 'token', None)
+    name = getattr(origin, 'template_name', None) or '<string>'
+    return f'{name}:{getattr(token, "lineno", "?")}'
+
+
+class Collector:
+    """Execute-обёртка, копящая запросы одного ответа по группам."""
+
+    def __init__(self):
+        self.groups = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - start
+            key = (fingerprint(sql), location())
+            group = self.groups.get(key)
+            if group is None:
+                self.groups[key] = [1, elapsed, elapsed]
+            else:
+                group[0] += 1
+                group[1] += elapsed
+                group[2] = max(group[2], elapsed)
+
+    def slow(self, threshold):
+        """Группы не быстрее порога, самые долгие первыми."""
+        found = [
+            (total, count, longest, sql, where)
+            for (sql, where), (count, total, longest) in self.groups.items()
+            if total >= threshold
+        ]
+        return sorted(found, reverse=True)
+
+
+class SlowQueryMiddleware:
+    def __init__(self, get_response):
+        if settings.SLOW_QUERY_THRESHOLD is None:
+            raise MiddlewareNotUsed
+        Node.render_annotated = located_render
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = Collector()
+        _local.nodes = []
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(collector))
+                response = self.get_response(request)
+        finally:
+            _local.nodes = None
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+        for total, count, longest, sql, where in collector.slow(
+                settings.SLOW_QUERY_THRESHOLD):
+            logger.warning(
+                'Медленный SQL в %s: %d раз, всего %.1f мс, максимум '
+                '%.1f мс, %s: %s',
+                view, count, total * 1000, longest * 1000,
+                f'шаблон {where}' if where else 'вне шаблонов', sql,
+                extra={
+                    'view': view,
+                    'template': where,
+                    'fingerprint': sql,
+                    'count': count,
+                    'total_ms': round(total * 1000, 2),
+                },
+            )
+        return response
@@ -0,0 +1,65 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TransactionTestCase
+
+from posts.models import Comment, Group, Post
+from posts.views import post_create
+
+User = get_user_model()
+
+
+class BenchViewsCommandTest(TransactionTestCase):
+    # Пишущие представления должны пройти настоящий COMMIT.
+    def setUp(self):
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        group = Group.objects.create(
+            title='заголовок', description='описание', slug='bench')
+        post = Post.objects.create(text='пост', author=author, group=group)
+        Comment.objects.create(post=post, author=reader, text='коммент')
+        handle, self.output = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.addCleanup(os.remove, self.output)
+
+    def bench(self, **options):
+        call_command(
+            'bench_views', repeat=1, warmup=0, output=self.output,
+            stdout=StringIO(), **options)
+        with open(self.output, encoding='utf-8') as output:
+            return json.load(output)
+
+    def test_results_recorded_and_rolled_back(self):
+        """Все представления замерены, а записи откатились."""
+        views = self.bench()['views']
+        self.assertEqual(views['posts:index']['status'], 200)
+        self.assertEqual(views['posts:post_create [POST]']['status'], 302)
+        self.assertIn('users:password_reset_confirm', views)
+        for name, result in views.items():
+            with self.subTest(name=name):
+                self.assertLess(result['status'], 400)
+                for key in ('p50_ms', 'p99_ms', 'queries', 'sql_ms',
+                            'render_ms'):
+                    self.assertIn(key, result)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+        # Без внешней транзакции нет лишнего SAVEPOINT: запись идёт
+        # настоящим путём и укладывается в бюджет представления.
+        self.assertLessEqual(
+            views['posts:post_create [POST]']['queries'],
+            post_create.query_budget)
+
+    def test_baseline_regression(self):
+        """Рост числа запросов относительно базы — ошибка."""
+        baseline = self.bench()
+        baseline['views']['posts:post_detail']['queries'] -= 1
+        handle, path = tempfile.mkstemp(suffix='.json')
+        with os.fdopen(handle, 'w', encoding='utf-8') as output:
+            json.dump(baseline, output)
+        self.addCleanup(os.remove, path)
+        with self.assertRaisesMessage(CommandError, 'posts:post_detail'):
+            self.bench(baseline=path)
@@ -0,0 +1,37 @@
+import os
+import tempfile
+
+from django.db import connection
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.test import SimpleTestCase, override_settings
+
+from core.db import pragma_statements
+
+
+class SqlitePragmasTest(SimpleTestCase):
+    def test_memory_database_skips_file_pragmas(self):
+        """Для базы в памяти WAL и mmap не включаются."""
+        pragmas = {'journal_mode': 'WAL', 'mmap_size': 1, 'temp_store': 2}
+        self.assertEqual(
+            pragma_statements(pragmas, in_memory=True),
+            ['PRAGMA temp_store = 2'],
+        )
+
+    @override_settings(SQLITE_PRAGMAS={
+        'journal_mode': 'WAL', 'busy_timeout': 1234})
+    def test_pragmas_applied_to_new_connection(self):
+        """Новое соединение с файлом базы получает PRAGMA из настроек."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = dict(
+            connection.settings_dict,
+            NAME=os.path.join(directory.name, 'pragmas.sqlite3'),
+        )
+        wrapper = DatabaseWrapper(settings_dict, alias='pragmas')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        raw = wrapper.connection
+        self.assertEqual(
+            raw.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        self.assertEqual(
+            raw.execute('PRAGMA busy_timeout').fetchone()[0], 1234)
@@ -0,0 +1,78 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.metrics import Histogram, registry
+from posts.models import Post
+
+User = get_user_model()
+
+
+class MetricsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='пост', author=author)
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+
+    def metrics(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_view_metrics_exported(self):
+        """Ответы считаются по имени представления вместе с кэшем и SQL."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        self.client.get('/no-such-page/')
+        text = self.metrics()
+        view = 'view="posts:index"'
+        self.assertIn(f'yatube_request_duration_seconds_count{{{view}}} 2',
+                      text)
+        self.assertIn(
+            f'yatube_request_duration_seconds_bucket{{{view},le="+Inf"}} 2',
+            text)
+        self.assertIn(f'yatube_requests_total{{{view},status="2xx"}} 2',
+                      text)
+        self.assertIn(
+            'yatube_requests_total{view="unresolved",status="4xx"} 1', text)
+        stats = registry.views['posts:index']
+        self.assertGreater(stats.queries.sum, 0)
+        self.assertGreater(stats.render_seconds, 0)
+        # Второй запрос отдан из кэша страниц.
+        self.assertGreater(stats.cache_hits, 0)
+        self.assertGreater(stats.cache_lookups, stats.cache_hits)
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_metrics_forbidden_for_others(self):
+        """Чужим адресам метрики не отдаются."""
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_histogram_buckets_cumulative(self):
+        """Корзины гистограммы накопительные и включают границу."""
+        histogram = Histogram((1, 5))
+        for value in (0, 1, 3, 7):
+            histogram.observe(value)
+        self.assertEqual(
+            list(histogram.cumulative()),
+            [('1', 2), ('5', 3), ('+Inf', 4)],
+        )
+        self.assertEqual(histogram.sum, 11)
+
+    def test_write_metrics_exported(self):
+        """Пишущие транзакции выводятся по имени функции."""
+        registry.observe_write('posts.views.add_comment', 2, 0.5, False)
+        registry.observe_write('posts.views.add_comment', 5, 1.0, True)
+        text = self.metrics()
+        function = 'function="posts.views.add_comment"'
+        self.assertIn(f'yatube_write_transactions_total{{{function}}} 2',
+                      text)
+        self.assertIn(f'yatube_write_retries_total{{{function}}} 7', text)
+        self.assertIn(f'yatube_write_failures_total{{{function}}} 1', text)
+        self.assertIn(f'yatube_write_wait_seconds_total{{{function}}} 1.5',
+                      text)
@@ -0,0 +1,73 @@
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import TestCase, override_settings
+from django.urls import path
+
+from core.nplusone import QueryAuditError, QueryAuditMixin, query_budget
+from posts.models import Post
+
+User = get_user_model()
+
+
+def authors_loop(request):
+    names = [post.author.username for post in Post.objects.all()]
+    return HttpResponse(' '.join(names))
+
+
+@query_budget(1)
+def authors_joined(request):
+    posts = Post.objects.select_related('author')
+    return HttpResponse(' '.join(post.author.username for post in posts))
+
+
+@query_budget(0)
+def over_budget(request):
+    return HttpResponse(str(Post.objects.count()))
+
+
+@query_budget(1, allow=(r'"auth_user"',))
+def allowed_loop(request):
+    return authors_loop(request)
+
+
+urlpatterns = [
+    path('loop/', authors_loop),
+    path('joined/', authors_joined),
+    path('over/', over_budget),
+    path('allowed/', allowed_loop),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class QueryAuditTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(3):
+            author = User.objects.create_user(username=f'author{number}')
+            Post.objects.create(text='пост', author=author)
+
+    def test_n_plus_one_raises(self):
+        """Один запрос в цикле с разными параметрами — ошибка в тестах."""
+        with self.assertRaisesMessage(QueryAuditError, 'N+1'):
+            self.client.get('/loop/')
+
+    def test_joined_query_passes(self):
+        """Запрос с select_related укладывается в бюджет."""
+        self.assertEqual(self.client.get('/joined/').status_code, 200)
+
+    def test_budget_exceeded_raises(self):
+        """Запросов больше бюджета представления — ошибка."""
+        with self.assertRaisesMessage(QueryAuditError, 'бюджете 0'):
+            self.client.get('/over/')
+
+    def test_allowlisted_queries_ignored(self):
+        """Допустимые отпечатки не считаются ни повтором, ни в бюджет."""
+        self.assertEqual(self.client.get('/allowed/').status_code, 200)
+
+    @override_settings(QUERY_AUDIT='log')
+    def test_logged_outside_tests(self):
+        """В режиме журнала ответ отдаётся, а N+1 пишется в лог."""
+        with self.assertLogs('core.nplusone', 'WARNING') as logs:
+            response = self.client.get('/loop/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('"auth_user"', logs.output[0])
@@ -0,0 +1,63 @@
+import os
+import pstats
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.profiling import make_token
+from posts.models import Post
+
+User = get_user_model()
+PROFILE_DIR = tempfile.mkdtemp()
+
+
+@override_settings(PROFILE_DIR=PROFILE_DIR)
+class ProfilingMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='пост', author=author)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        shutil.rmtree(PROFILE_DIR, ignore_errors=True)
+
+    def profiles(self):
+        if not os.path.isdir(PROFILE_DIR):
+            return []
+        return os.listdir(PROFILE_DIR)
+
+    def test_signed_header_profiles_request(self):
+        """С подписанным заголовком пишется профиль с именем
+        представления и числом запросов."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]),
+            HTTP_X_PROFILE=make_token(),
+        )
+        name = response['X-Profile-File']
+        self.assertEqual(self.profiles(), [name])
+        self.assertIn('-posts.post_detail-', name)
+        self.assertRegex(name, r'-\d+q-')
+        stats = pstats.Stats(os.path.join(PROFILE_DIR, name))
+        self.assertGreater(stats.total_calls, 0)
+
+    def test_unsigned_header_ignored(self):
+        """Без подписи и выборки запрос не профилируется."""
+        response = self.client.get(
+            reverse('posts:index'), HTTP_X_PROFILE='profile:forged:sig')
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(self.profiles(), [])
+
+    @override_settings(PROFILE_SAMPLE_RATE=1)
+    def test_sampled_request_profiled(self):
+        """Запрос из выборки профилируется без заголовка в ответе."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(len(self.profiles()), 1)
@@ -0,0 +1,141 @@
+import os
+import sqlite3
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+
+from core.routers import ReplicaMiddleware, ReplicaRouter
+from posts.models import Post
+
+User = get_user_model()
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTest(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def serve(self, request, write=None):
+        """Пропустить запрос через middleware; вернуть ответ и базы
+        чтения поста и сессии внутри представления."""
+        seen = {}
+
+        def view(request):
+            if write is not None:
+                self.router.db_for_write(write)
+            seen['post'] = self.router.db_for_read(Post)
+            seen['session'] = self.router.db_for_read(Session)
+            return HttpResponse()
+        return ReplicaMiddleware(view)(request), seen
+
+    def test_safe_requests_read_from_replica(self):
+        """GET читает посты с реплики, сессии — с основной базы."""
+        response, seen = self.serve(self.factory.get('/'))
+        self.assertEqual(seen, {'post': 'replica', 'session': None})
+        self.assertNotIn('primary', response.cookies)
+
+    def test_primary_outside_requests(self):
+        """Вне запроса и для POST чтение идёт с основной базы."""
+        self.assertIsNone(self.router.db_for_read(Post))
+        response, seen = self.serve(self.factory.post('/'))
+        self.assertIsNone(seen['post'])
+
+    def test_write_pins_browser_to_primary(self):
+        """После записи браузер читает с основной базы, пока жива
+        cookie."""
+        response, seen = self.serve(self.factory.get('/'), write=Post)
+        self.assertIsNone(seen['post'])
+        cookie = response.cookies['primary']
+        self.assertEqual(cookie['max-age'], 10)
+        request = self.factory.get('/')
+        request.COOKIES['primary'] = cookie.value
+        response, seen = self.serve(request)
+        self.assertIsNone(seen['post'])
+
+    def test_session_write_does_not_pin(self):
+        """Сохранение сессии не считается записью пользователя."""
+        response, seen = self.serve(self.factory.get('/'), write=Session)
+        self.assertEqual(seen['post'], 'replica')
+        self.assertNotIn('primary', response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=['replica_a', 'replica_b'])
+    def test_one_replica_per_request(self):
+        """Все чтения запроса идут на одну реплику."""
+        for _ in range(10):
+            chosen = set()
+
+            def view(request):
+                for _ in range(5):
+                    chosen.add(self.router.db_for_read(Post))
+                return HttpResponse()
+            ReplicaMiddleware(view)(self.factory.get('/'))
+            self.assertEqual(len(chosen), 1)
+
+    def test_migrations_skip_replicas(self):
+        self.assertFalse(self.router.allow_migrate('replica', 'posts'))
+        self.assertTrue(self.router.allow_migrate('default', 'posts'))
+
+
+class SyncReplicaTest(TransactionTestCase):
+    # backup API ждёт конца открытой транзакции TestCase.
+    def test_copies_primary_to_file(self):
+        """Копия содержит строки основной базы."""
+        author = User.objects.create_user(username='author')
+        Post.objects.create(text='пост', author=author)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'replica.sqlite3')
+        call_command('sync_replica', path, stdout=StringIO())
+        replica = sqlite3.connect(path)
+        self.addCleanup(replica.close)
+        self.assertEqual(
+            replica.execute('SELECT text FROM posts_post').fetchall(),
+            [('пост',)],
+        )
+
+
+class ReplicaPageCacheTest(TransactionTestCase):
+    databases = {DEFAULT_DB_ALIAS, 'replica'}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.databases['replica'] = {
+            **connections.databases[DEFAULT_DB_ALIAS],
+            'NAME': os.path.join(cls.directory.name, 'replica.sqlite3'),
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections['replica'].close()
+        del connections['replica']
+        del connections.databases['replica']
+        cls.directory.cleanup()
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_sync_refreshes_pages_read_from_replica(self):
+        """Страница, закэшированная с отставшей реплики, обновляется
+        после sync_replica, и старый ETag уже не даёт 304."""
+        cache.clear()
+        author = User.objects.create_user(username='author')
+        call_command('sync_replica', stdout=StringIO())
+        url = reverse('posts:index')
+        self.client.get(url)
+        Post.objects.create(text='свежий пост', author=author)
+        response = self.client.get(url)
+        self.assertNotContains(response, 'свежий пост')
+        call_command('sync_replica', stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertContains(response, 'свежий пост')
@@ -0,0 +1,237 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import sharding
+from posts.models import Comment, Counters, Follow, Group, Post
+
+User = get_user_model()
+
+SHARDS = ('shard_a', 'shard_b')
+
+
+class ShardDatabasesMixin:
+    """Два временных файла SQLite в роли шардов."""
+
+    databases = {DEFAULT_DB_ALIAS, *SHARDS}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.shard_dir = tempfile.TemporaryDirectory()
+        for alias in SHARDS:
+            connections.databases[alias] = {
+                'ENGINE': connections[DEFAULT_DB_ALIAS].settings_dict[
+                    'ENGINE'],
+                'NAME': os.path.join(cls.shard_dir.name, f'{alias}.sqlite3'),
+            }
+            call_command('migrate', database=alias, verbosity=0)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in SHARDS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.databases[alias]
+        cls.shard_dir.cleanup()
+
+    def setUp(self):
+        cache.clear()
+        # Блоки id из прошлого теста указывают на сброшенную таблицу.
+        sharding._blocks.clear()
+
+    def shard_pks(self, model, alias):
+        return set(model._base_manager.using(alias).values_list(
+            'pk', flat=True))
+
+
+@override_settings(
+    SHARD_DATABASES=list(SHARDS), FOLLOW_FEED='heads', QUERY_AUDIT=None)
+class ShardingTest(ShardDatabasesMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='')
+        self.authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(len(SHARDS))
+        ]
+        self.reader = User.objects.create_user(username='reader')
+
+    def create_posts(self, count):
+        return [
+            Post.objects.create(
+                text=f'пост {number}', group=self.group,
+                author=self.authors[number % len(self.authors)])
+            for number in range(count)
+        ]
+
+    def test_rows_live_on_author_shard(self):
+        """Пост, его комментарии и подписки на автора — в шарде автора,
+        копии пользователей и групп — на всех шардах."""
+        author = self.authors[0]
+        home = sharding.shard_for(author.pk)
+        other = next(alias for alias in SHARDS if alias != home)
+        post = Post.objects.create(text='пост', author=author)
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='комментарий')
+        follow = Follow.objects.create(user=self.reader, author=author)
+        for model, pk in ((Post, post.pk), (Comment, comment.pk),
+                          (Follow, follow.pk)):
+            self.assertEqual(self.shard_pks(model, home), {pk})
+            self.assertEqual(self.shard_pks(model, other), set())
+            self.assertEqual(self.shard_pks(model, DEFAULT_DB_ALIAS), set())
+        for alias in SHARDS:
+            self.assertTrue(User.objects.using(alias).filter(
+                username='reader').exists())
+            self.assertTrue(Group.objects.using(alias).filter(
+                slug='group').exists())
+        self.assertEqual(Post.objects.get(pk=post.pk).author, author)
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_index_merges_shards_in_order(self):
+        """Общая лента сливает шарды по (pub_date, id), курсор ведёт на
+        продолжение без пропусков."""
+        created = self.create_posts(settings.POSTS_LIM * 2 + 3)
+        expected = [
+            post.pk for post in sorted(
+                created, key=lambda post: (post.pub_date, post.pk),
+                reverse=True)
+        ]
+        for alias in SHARDS:
+            self.assertTrue(self.shard_pks(Post, alias))
+        shown = []
+        params = {}
+        while True:
+            page = self.client.get(
+                reverse('posts:index'), params).context['page_obj']
+            shown += [post.pk for post in page]
+            if page.next_cursor is None:
+                break
+            params = {'after': page.next_cursor}
+        self.assertEqual(shown, expected)
+        # Ключ слияния не выбран в values_list: он дочитывается и
+        # отбрасывается.
+        texts = {post.pk: post.text for post in created}
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)[2:5]),
+            [texts[pk] for pk in expected[2:5]],
+        )
+        self.assertEqual(
+            list(Post.objects.order_by('-pk').values('text')[:2]),
+            [{'text': texts[pk]} for pk in sorted(texts, reverse=True)[:2]],
+        )
+
+    def test_profile_reads_author_shard_only(self):
+        """Профиль читает посты только из шарда автора."""
+        self.create_posts(4)
+        author = self.authors[0]
+        home = sharding.shard_for(author.pk)
+        other = next(alias for alias in SHARDS if alias != home)
+        with CaptureQueriesContext(connections[home]) as own, \
+                CaptureQueriesContext(connections[other]) as foreign:
+            response = self.client.get(
+                reverse('posts:profile', args=[author.username]))
+        self.assertEqual(len(response.context['page_obj']), 2)
+        self.assertTrue(own.captured_queries)
+        self.assertEqual(foreign.captured_queries, [])
+
+    def test_follow_feed_and_comments(self):
+        """Подписки на авторов разных шардов дают общую ленту,
+        комментарий ложится в шард поста и меняет его счётчик."""
+        posts = self.create_posts(4)
+        self.client.force_login(self.reader)
+        for author in self.authors:
+            self.client.get(
+                reverse('posts:profile_follow', args=[author.username]))
+            self.assertEqual(
+                self.shard_pks(Follow, sharding.shard_for(author.pk)),
+                set(Follow.objects.filter(author=author).values_list(
+                    'pk', flat=True)),
+            )
+        page = self.client.get(
+            reverse('posts:follow_index')).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in page], [post.pk for post in posts[::-1]])
+        post = posts[0]
+        self.client.post(
+            reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'комментарий'})
+        comment = Comment.objects.get(post=post)
+        self.assertIn(comment.pk, self.shard_pks(Comment, post._state.db))
+        self.assertEqual(Post.objects.get(pk=post.pk).comments_count, 1)
+
+    def test_reconcile_sums_shards(self):
+        """reconcile_counters складывает строки со всех шардов, а
+        rebuild_timelines с шардами не запускается."""
+        posts = self.create_posts(4)
+        for author in self.authors:
+            Follow.objects.create(user=self.reader, author=author)
+        Comment.objects.create(
+            post=posts[1], author=self.reader, text='комментарий')
+        Counters.objects.update(
+            posts_count=9, followers_count=9, following_count=9)
+        for alias in SHARDS:
+            Post._base_manager.using(alias).update(comments_count=5)
+        call_command('reconcile_counters', stdout=StringIO())
+        for author in self.authors:
+            self.assertEqual(
+                Counters.objects.values_list(
+                    'posts_count', 'followers_count').get(user=author),
+                (2, 1))
+        self.assertEqual(
+            Counters.objects.get(user=self.reader).following_count,
+            len(self.authors))
+        self.assertEqual(
+            [Post.objects.get(pk=post.pk).comments_count for post in posts],
+            [0, 1, 0, 0])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_timelines', stdout=StringIO())
+
+
+class RebalanceShardsTest(ShardDatabasesMixin, TransactionTestCase):
+    def test_rows_follow_new_shard_list(self):
+        """После добавления шарда посты переезжают с комментариями,
+        а id и счётчики не меняются."""
+        with self.settings(SHARD_DATABASES=[SHARDS[0]],
+                           FOLLOW_FEED='heads'):
+            authors = [
+                User.objects.create_user(username=f'author{number}')
+                for number in range(4)
+            ]
+            for author in authors:
+                post = Post.objects.create(text='пост', author=author)
+                Comment.objects.create(
+                    post=post, author=authors[0], text='комментарий')
+                Follow.objects.create(user=authors[0], author=author)
+        before = self.shard_pks(Post, SHARDS[0])
+        with self.settings(SHARD_DATABASES=list(SHARDS),
+                           FOLLOW_FEED='heads'):
+            output = StringIO()
+            call_command('rebalance_shards', dry_run=True, stdout=output)
+            self.assertEqual(self.shard_pks(Post, SHARDS[1]), set())
+            self.assertIn('posts.Post: shard_a -> shard_b 2',
+                          output.getvalue())
+            call_command('rebalance_shards', stdout=StringIO())
+            for alias in SHARDS:
+                for post in Post.objects.using(alias).select_related(
+                        'author'):
+                    self.assertEqual(
+                        sharding.shard_for(post.author_id), alias)
+                    self.assertEqual(post.comments.count(), 1)
+            self.assertEqual(
+                self.shard_pks(Post, SHARDS[0])
+                | self.shard_pks(Post, SHARDS[1]), before)
+            self.assertEqual(Follow.objects.count(), 4)
+            new = Post.objects.create(text='новый', author=authors[1])
+            self.assertGreater(new.pk, max(before))
@@ -0,0 +1,60 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core.slow_queries import fingerprint
+from posts.models import Post
+
+User = get_user_model()
+
+
+class FingerprintTest(SimpleTestCase):
+    def test_values_removed(self):
+        """Отпечаток не зависит от значений и длины списков IN."""
+        self.assertEqual(
+            fingerprint(
+                "SELECT  * FROM t WHERE a = 'it''s' AND b IN (%s, %s, %s)\n"
+                "LIMIT 21"),
+            'SELECT * FROM t WHERE a = %s AND b IN (...) LIMIT %s',
+        )
+        self.assertEqual(
+            fingerprint('SELECT "t1"."id" FROM "t1" WHERE x IN (%s, %s)'),
+            fingerprint('SELECT "t1"."id" FROM "t1" WHERE x IN (%s, %s, %s)'),
+        )
+
+
+@override_settings(SLOW_QUERY_THRESHOLD=0)
+class SlowQueryMiddlewareTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Post.objects.create(text='пост', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    def test_query_from_template_located(self):
+        """Запрос из шаблона записан с представлением и строкой шаблона."""
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get(
+                reverse('posts:profile', args=[self.author.username]))
+        records = {
+            record.template: record for record in logs.records
+        }
+        self.assertIn('posts/includes/follow_button.html:3', records)
+        record = records['posts/includes/follow_button.html:3']
+        self.assertEqual(record.view, 'posts:profile')
+        self.assertIn('"posts_follow"', record.fingerprint)
+        self.assertIsNone(records[None].template)
+
+    def test_identical_queries_grouped(self):
+        """Одинаковые запросы ответа сводятся в одну запись."""
+        with self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        fingerprints = [
+            (record.fingerprint, record.template) for record in logs.records
+        ]
+        self.assertEqual(len(fingerprints), len(set(fingerprints)))
@@ -0,0 +1,54 @@
+import logging
+
+from django.core.management import CommandError
+from django.test import SimpleTestCase
+
+from core.management.commands.soak import (LOCK_LOGGERS, LockErrors, Sample,
+                                           classify, parse_mix, summarize)
+from core.transactions import busy_response
+
+
+class SoakHelpersTest(SimpleTestCase):
+    def test_parse_mix(self):
+        """Доли действий разбираются, неизвестные действия — ошибка."""
+        self.assertEqual(
+            parse_mix('feed=80,comment=5'), {'feed': 80.0, 'comment': 5.0})
+        for value in ('feed=80,like=5', 'feed=много', 'feed=0'):
+            with self.subTest(value=value):
+                with self.assertRaises(CommandError):
+                    parse_mix(value)
+
+    def test_summarize(self):
+        """Сводка считает запросы в секунду, хвосты и долю ошибок."""
+        samples = [
+            Sample(at / 10, 'feed', 0.01 * (at + 1), 200, None)
+            for at in range(10)
+        ] + [Sample(1.8, 'comment', 0.5, 500, 'http 500')]
+        summary = summarize(samples)
+        self.assertEqual(summary['requests'], 11)
+        self.assertEqual(summary['rps'], round(11 / 1.8, 1))
+        self.assertEqual(summary['p50_ms'], 60.0)
+        self.assertEqual(summary['p99_ms'], 500.0)
+        self.assertEqual(summary['errors'], {'http 500': 1})
+        self.assertEqual(summary['error_rate'], round(1 / 11, 4))
+        self.assertEqual(summarize([]), {'requests': 0})
+
+    def test_lock_errors_counted(self):
+        """Ответ 503 с Retry-After — ошибка блокировки, и её видно
+        в логах сервера."""
+        self.assertEqual(classify(503, '1'), 'locked')
+        self.assertEqual(classify(503, None), 'http 503')
+        self.assertIsNone(classify(302, None))
+        handler = LockErrors()
+        for name in LOCK_LOGGERS:
+            logging.getLogger(name).addHandler(handler)
+            self.addCleanup(logging.getLogger(name).removeHandler, handler)
+
+        logger = logging.getLogger('core.transactions')
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'propagate', True)
+        response = busy_response('posts.views.add_comment')
+        self.assertEqual(
+            classify(response.status_code, response['Retry-After']),
+            'locked')
+        self.assertEqual(handler.count, 1)
@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import tempfile
+from unittest import mock
+
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from core.backends.sqlite3.base import DatabaseWrapper
+from core.metrics import registry
+from core.transactions import write_transaction
+
+
+class ImmediateBackendTest(SimpleTestCase):
+    def test_begin_immediate_takes_write_lock(self):
+        """С флагом транзакция сразу берёт блокировку записи."""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        name = os.path.join(directory.name, 'immediate.sqlite3')
+        wrapper = DatabaseWrapper(
+            dict(connection.settings_dict, NAME=name), alias='immediate')
+        self.addCleanup(wrapper.close)
+        wrapper.ensure_connection()
+        wrapper.begin_immediate = True
+        wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(name, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with self.assertRaisesMessage(
+                sqlite3.OperationalError, 'database is locked'):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.connection.rollback()
+
+
+@mock.patch('core.transactions.time.sleep')
+class WriteTransactionTest(SimpleTestCase):
+    # Настоящие BEGIN IMMEDIATE и COMMIT вне транзакции TestCase.
+    databases = '__all__'
+
+    def setUp(self):
+        registry.reset()
+
+    def flaky(self, failures, error='database is locked'):
+        calls = []
+
+        def write(*args):
+            calls.append(args)
+            if len(calls) <= failures:
+                raise OperationalError(error)
+            return 'записано'
+        return write, calls
+
+    def test_busy_database_retried(self, sleep):
+        """Занятая база — повтор с задержкой и учётом в метриках."""
+        write, calls = self.flaky(2)
+        with self.settings(WRITE_RETRIES=3):
+            self.assertEqual(write_transaction(write)(), 'записано')
+        self.assertEqual(len(calls), 3)
+        stats = registry.writes[f'{write.__module__}.{write.__qualname__}']
+        self.assertEqual((stats.transactions, stats.retries), (1, 2))
+        self.assertEqual(stats.failures, 0)
+
+    def test_other_errors_not_retried(self, sleep):
+        """Прочие ошибки базы не повторяются."""
+        write, calls = self.flaky(1, error='no such table: posts_post')
+        with self.assertRaises(OperationalError):
+            write_transaction(write)()
+        self.assertEqual(len(calls), 1)
+
+    def test_view_answers_503_when_exhausted(self, sleep):
+        """Представление без блокировки отвечает 503, а не 500."""
+        write, calls = self.flaky(10)
+        request = RequestFactory().post('/')
+        with self.settings(WRITE_RETRIES=2):
+            response = write_transaction(write)(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_safe_methods_skip_transaction(self, sleep):
+        """GET формы выполняется без пишущей транзакции."""
+        view = write_transaction(
+            lambda request: HttpResponse('форма'), methods=('POST',))
+        view(RequestFactory().get('/'))
+        self.assertEqual(registry.writes, {})
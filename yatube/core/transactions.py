@@ -0,0 +1,132 @@
+"""Пишущие транзакции SQLite без «database is locked» в ответах.
+
+``write_transaction`` выполняет функцию в ``atomic`` с ``BEGIN
+IMMEDIATE`` (см. ``core.backends.sqlite3``) и при занятой базе повторяет
+её целиком с экспоненциальной задержкой и случайным разбросом. Повторы,
+ожидание и отказы попадают в метрики ``/metrics/``. Представление, так и
+не дождавшееся блокировки, отвечает 503 с ``Retry-After`` вместо 500.
+
+Блокировка держится всё время работы функции, поэтому долгое (разбор
+формы, обработка картинки) делается до неё: представление оборачивается
+в ``busy_unavailable``, а ``write_transaction`` получает только запись.
+"""
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db import transaction
+from django.http import HttpRequest, HttpResponse
+
+from core.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Писатели одного процесса ждут друг друга здесь, а не в цикле
+# busy_timeout SQLite, который опрашивает блокировку с задержками и не
+# соблюдает очередь.
+_write_locks = defaultdict(threading.Lock)
+
+BUSY_MESSAGES = ('database is locked', 'database table is locked',
+                 'database is busy')
+
+
+def is_busy(error):
+    return any(message in str(error) for message in BUSY_MESSAGES)
+
+
+def backoff(attempt):
+    """Задержка перед повтором: случайная доля от удвоенной базы."""
+    return random.uniform(0, settings.WRITE_RETRY_DELAY * 2 ** attempt)
+
+
+@contextmanager
+def immediate(connection):
+    with _write_locks[connection.alias]:
+        connection.begin_immediate = True
+        try:
+            yield
+        finally:
+            connection.begin_immediate = False
+
+
+def run_immediate(func, args, kwargs, using, name):
+    """Вызвать ``func`` в транзакции BEGIN IMMEDIATE, повторяя при
+    занятой базе; после последней попытки ошибка пробрасывается."""
+    connection = connections[using or DEFAULT_DB_ALIAS]
+    started = time.perf_counter()
+    for attempt in range(settings.WRITE_RETRIES + 1):
+        waited = time.perf_counter() - started
+        try:
+            with immediate(connection), transaction.atomic(using=using):
+                result = func(*args, **kwargs)
+        except OperationalError as error:
+            if not is_busy(error):
+                raise
+            if attempt < settings.WRITE_RETRIES:
+                time.sleep(backoff(attempt))
+                continue
+            registry.observe_write(name, attempt, waited, failed=True)
+            raise
+        registry.observe_write(name, attempt, waited, failed=False)
+        return result
+
+
+def write_transaction(func=None, *, using=None, methods=None):
+    """Декоратор пишущей транзакции с повторами.
+
+    Для представлений ``methods`` ограничивает транзакцию методами
+    запроса: GET формы не должен занимать блокировку записи.
+    """
+    if func is None:
+        return lambda func: write_transaction(
+            func, using=using, methods=methods)
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        request = args[0] if args and isinstance(
+            args[0], HttpRequest) else None
+        if methods and request is not None and (
+                request.method not in methods):
+            return func(*args, **kwargs)
+        if connections[using or DEFAULT_DB_ALIAS].in_atomic_block:
+            # Внешняя транзакция уже открыта: повторять её не нам.
+            with transaction.atomic(using=using):
+                return func(*args, **kwargs)
+        try:
+            return run_immediate(func, args, kwargs, using, name)
+        except OperationalError as error:
+            if request is None or not is_busy(error):
+                raise
+            return busy_response(name)
+    return wrapper
+
+
+def busy_response(name):
+    logger.warning('База занята: %s не записан', name)
+    response = HttpResponse(
+        'Сервис перегружен, повторите запрос', status=503)
+    response['Retry-After'] = '1'
+    return response
+
+
+def busy_unavailable(view):
+    """503 вместо 500 для представления, чья запись внутри
+    ``write_transaction`` так и не дождалась блокировки."""
+    name = f'{view.__module__}.{view.__qualname__}'
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except OperationalError as error:
+            if not is_busy(error):
+                raise
+            return busy_response(name)
+    return wrapper
@@ -1,6 +1,12 @@
 from http import HTTPStatus
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from core.metrics import registry
+
 
 def page_not_found(request, exception):
     return render(
@@ -18,3 +24,13 @@ def csrf_failure(request, reason=""):
 def permission_denied(request, exception):
     """Настройка шаблона для страницы с ошибкой 403."""
     return render(request, "core/403.html", status=HTTPStatus.FORBIDDEN)
+
+
+def metrics(request):
+    """Метрики в формате Prometheus, только с доверенных адресов."""
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        raise PermissionDenied
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
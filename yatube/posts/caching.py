@@ -0,0 +1,292 @@
+"""Кэш целых страниц на счётчиках поколений.
+
+У каждой области (вся лента, группа, автор, пост) есть номер поколения
+в кэше. Ключ страницы включает путь, канонические параметры ``PAGE_PARAMS`` и
+поколения её областей, поэтому инвалидация — это одно увеличение счётчика, а
+устаревшие страницы просто перестают запрашиваться и вытесняются.
+
+Анонимам отдаётся готовый ответ. Для вошедших пользователей кэшируется
+общий каркас страницы, в котором персональные фрагменты (тег
+``{% hole %}``) заменены метками; на каждый запрос рендерятся только
+эти фрагменты.
+
+Те же поколения служат валидатором ETag: клиент с актуальной версией
+получает 304 до любой работы с базой и шаблонами.
+
+С репликами страница могла быть прочитана с копии, отставшей от записи,
+уже сменившей поколение. Поэтому в ключ входит и поколение ``REPLICA``,
+которое ``manage.py sync_replica`` увеличивает после каждой копии.
+"""
+import hashlib
+import json
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import quote_etag, urlsafe_base64_decode
+
+from core.paginator import canonical_cursor
+
+GLOBAL = ('global', '')
+REPLICA = ('replica', '')
+FIELD_RE = re.compile(r'[a-z_]+')
+HOLE_RE = re.compile(rb'<!--hole:([\w=-]+)-->')
+
+
+def generation_key(scope, name):
+    digest = hashlib.md5(name.encode()).hexdigest()
+    return f'generation:{scope}:{digest}'
+
+
+def fresh_generation():
+    # Стартуем с микросекунд, чтобы вытесненный счётчик не вернулся
+    # к уже использованному значению.
+    return time.time_ns() // 1000
+
+
+def _increment(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, fresh_generation(), None)
+
+
+def bump(*scopes):
+    """Сменить поколения областей сразу и ещё раз после коммита.
+
+    Второе увеличение закрывает гонку, в которой читатель успел
+    закэшировать страницу по новому поколению до коммита записи.
+    """
+    keys = [generation_key(scope, name) for scope, name in scopes]
+    _increment(keys)
+    transaction.on_commit(lambda: _increment(keys))
+
+
+def bump_replica():
+    """Реплики догнали основную базу: страницы с их чтений устарели."""
+    _increment([generation_key(*REPLICA)])
+
+
+def generations(scopes):
+    if settings.DATABASE_REPLICAS:
+        scopes = [*scopes, REPLICA]
+    keys = [generation_key(scope, name) for scope, name in scopes]
+    found = cache.get_many(keys)
+    missing = {key: fresh_generation() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def canonical_number(value, high):
+    try:
+        number = int(value)
+    except ValueError:
+        return None
+    return str(number) if 1 <= number <= high else None
+
+
+def canonical_page(value):
+    return canonical_number(value, settings.PAGINATOR_MAX_PAGE)
+
+
+def canonical_limit(value):
+    # Представление само зажимает limit в [1, API_MAX_LIMIT].
+    try:
+        limit = int(value)
+    except ValueError:
+        return None
+    return str(max(1, min(limit, settings.API_MAX_LIMIT)))
+
+
+def canonical_fields(value):
+    names = [name for name in value.split(',') if name]
+    if not all(FIELD_RE.fullmatch(name) for name in names):
+        return None
+    return ','.join(dict.fromkeys(names))
+
+
+# Параметры, которые читают кэшируемые представления и API, и их
+# канонический вид.
+PAGE_PARAMS = (
+    ('page', canonical_page),
+    ('after', canonical_cursor),
+    ('before', canonical_cursor),
+    ('fields', canonical_fields),
+    ('limit', canonical_limit),
+)
+
+
+def page_params(request):
+    """Параметры страницы в каноническом виде.
+
+    Разные записи одной страницы (``?page=01``, лишние параметры) дают
+    один ключ. Если значение не проходит проверку, возвращается None и
+    страница не кэшируется: иначе любой клиент плодил бы записи и
+    вытеснял кэш.
+    """
+    params = []
+    for name, canonical in PAGE_PARAMS:
+        value = request.GET.get(name)
+        if not value:
+            continue
+        value = canonical(value)
+        if value is None:
+            return None
+        params.append(f'{name}={value}')
+    return params
+
+
+def page_key(request, versions, variant):
+    """Ключ страницы или None, если её параметры не кэшируются."""
+    params = page_params(request)
+    if params is None:
+        return None
+    raw = '|'.join([variant, request.path, *params] + [
+        str(version) for version in versions
+    ])
+    return 'page:' + hashlib.md5(raw.encode()).hexdigest()
+
+
+def page_etag(request, versions):
+    """ETag страницы: поколения, путь и всё, от чего зависят фрагменты.
+
+    Для вошедшего пользователя учитываются его id и CSRF-куки, которая
+    попадает в формы страницы.
+    """
+    user = request.user
+    personal = (
+        [str(user.pk), request.META.get('CSRF_COOKIE', '')]
+        if user.is_authenticated else []
+    )
+    key = page_key(request, versions, ':'.join(personal))
+    return quote_etag(key) if key is not None else None
+
+
+def not_modified(request, etag):
+    """Ответ 304 или 412, если валидатор клиента совпал, иначе None."""
+    return get_conditional_response(request, etag=etag)
+
+
+def set_validators(response, request, etag):
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Cookie',))
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
+
+
+def conditional_page(scopes_of):
+    """Отвечать 304 по ETag из поколений ``scopes_of(request, **kwargs)``.
+
+    Для представлений без кэша страниц, например персональной ленты.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            etag = page_etag(
+                request, generations(scopes_of(request, **kwargs)))
+            if etag is None:
+                return view(request, *args, **kwargs)
+            response = not_modified(request, etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code == 200:
+                    set_validators(response, request, etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def has_holes(anonymous, content_type):
+    """Метки фрагментов бывают только в HTML-каркасах вошедших.
+
+    В JSON текст поста не экранируется и мог бы сойти за метку.
+    """
+    return not anonymous and content_type.startswith('text/html')
+
+
+def fill_holes(content, request):
+    """Отрендерить персональные фрагменты каркаса для ``request``."""
+    def render_hole(match):
+        hole = json.loads(urlsafe_base64_decode(match.group(1).decode()))
+        return render_to_string(
+            hole['template'], hole['params'], request=request).encode()
+    return HOLE_RE.sub(render_hole, content)
+
+
+def cached_response(cached, request, anonymous, etag):
+    content, content_type = cached
+    if has_holes(anonymous, content_type):
+        content = fill_holes(content, request)
+    return set_validators(
+        HttpResponse(content, content_type=content_type), request, etag)
+
+
+def store_response(response, key, request, anonymous, etag):
+    """Положить свежий ответ (каркас для вошедших) в кэш и отдать его."""
+    if response.status_code != 200 or response.streaming:
+        return response
+    cache.set(
+        key, (response.content, response['Content-Type']),
+        settings.PAGE_CACHE_TIMEOUT
+    )
+    if has_holes(anonymous, response['Content-Type']):
+        response.content = fill_holes(response.content, request)
+    return set_validators(response, request, etag)
+
+
+def cached_page(scope, kwarg=None, related=None):
+    """Кэшировать GET-ответы представления по поколениям области.
+
+    ``scope`` — область поколений, ``kwarg`` — аргумент представления
+    с именем объекта области (slug группы, username автора, id поста).
+    ``related(**kwargs)`` возвращает ещё области, чьи данные есть на
+    странице: у поста это его автор и группа.
+    Ответы несут ETag, и совпавший ``If-None-Match`` получает 304.
+    """
+    def page_scopes(kwargs):
+        scopes = [(scope, str(kwargs.get(kwarg, '')))]
+        if related is not None:
+            scopes += related(**kwargs)
+        return scopes
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            anonymous = not request.user.is_authenticated
+            versions = generations(page_scopes(kwargs))
+            etag = page_etag(request, versions)
+            if etag is None:
+                return view(request, *args, **kwargs)
+            response = not_modified(request, etag)
+            if response is not None:
+                return response
+            key = page_key(
+                request, versions, 'page' if anonymous else 'skeleton')
+            cached = cache.get(key)
+            if cached is not None:
+                return cached_response(cached, request, anonymous, etag)
+            request.punch_holes = not anonymous
+            try:
+                response = view(request, *args, **kwargs)
+            finally:
+                request.punch_holes = False
+            return store_response(response, key, request, anonymous, etag)
+        return wrapper
+    return decorator
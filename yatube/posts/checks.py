@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.core import checks
+
+
+def check_follow_feed(app_configs, **kwargs):
+    """Таблица Timeline ссылается на посты из одной базы: с шардами
+    лента подписок собирается только из голов авторов."""
+    if settings.SHARD_DATABASES and settings.FOLLOW_FEED != 'heads':
+        return [checks.Error(
+            "С SHARD_DATABASES нужен FOLLOW_FEED = 'heads'.",
+            id='posts.E001',
+        )]
+    return []
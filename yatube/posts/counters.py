@@ -0,0 +1,127 @@
+"""Денормализованные счётчики вместо COUNT(*) в шаблонах.
+
+``Post.comments_count`` и строка ``Counters`` пользователя меняются
+атомарными ``F()``-обновлениями из сигналов. Если счётчики разошлись
+с данными (массовая загрузка, ручные правки в базе), их выравнивает
+``manage.py reconcile_counters``.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from core import sharding
+
+from .models import Comment, Counters, Follow, Post
+
+User = get_user_model()
+
+
+def shifted(field, delta):
+    # Разошедшийся счётчик (loaddata, update() в обход сигналов) мог
+    # уже дойти до нуля: уход в минус нарушил бы CHECK и уронил удаление.
+    return Greatest(F(field) + delta, 0)
+
+
+def bump_user(user_id, **deltas):
+    updated = Counters.objects.filter(user_id=user_id).update(**{
+        field: shifted(field, delta) for field, delta in deltas.items()
+    })
+    # Строку не создал сигнал (loaddata, bulk_create): считаем заново.
+    # При удалениях строки нет и у удаляемого каскадом пользователя,
+    # а недостающую строку всё равно восстановит ``of``.
+    if not updated and all(delta > 0 for delta in deltas.values()):
+        restore(user_id)
+
+
+def restore(user_id):
+    """Создать недостающую строку счётчиков и посчитать её по данным."""
+    Counters.objects.bulk_create(
+        [Counters(user_id=user_id)], ignore_conflicts=True)
+    recount(Counters.objects.filter(user_id=user_id))
+
+
+def of(user):
+    """Счётчики пользователя; пропавшая строка создаётся на лету."""
+    try:
+        return user.counters
+    except Counters.DoesNotExist:
+        restore(user.pk)
+        user.counters = Counters.objects.get(user_id=user.pk)
+        return user.counters
+
+
+def bump_comments(post_id, delta, using=None):
+    # Пост лежит в той же базе, что и его комментарий.
+    Post.objects.db_manager(using).filter(pk=post_id).update(
+        comments_count=shifted('comments_count', delta))
+
+
+COUNTED = (
+    ('posts_count', Post, 'author'),
+    ('followers_count', Follow, 'author'),
+    ('following_count', Follow, 'user'),
+)
+
+
+def count_of(queryset, field):
+    """Коррелированный подзапрос COUNT(*) по полю ``field``."""
+    counted = queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+        field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted), Value(0))
+
+
+def recount(counters):
+    if sharding.enabled():
+        recount_shards(counters)
+        return
+    counters.update(**{
+        field: count_of(model.objects.all(), key)
+        for field, model, key in COUNTED
+    })
+
+
+def recount_shards(counters, batch_size=500):
+    """Подзапрос видит одну базу: с шардами строки считаются на каждом
+    из них, а суммы записываются пачками."""
+    objs = list(counters)
+    fields = [field for field, _, _ in COUNTED]
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        user_ids = [obj.user_id for obj in batch]
+        totals = {field: Counter() for field in fields}
+        for alias in settings.SHARD_DATABASES:
+            for field, model, key in COUNTED:
+                totals[field].update(dict(
+                    model._base_manager.using(alias).filter(**{
+                        f'{key}__in': user_ids
+                    }).order_by().values(key).annotate(
+                        total=Count('pk')).values_list(key, 'total')
+                ))
+        for obj in batch:
+            for field in fields:
+                setattr(obj, field, totals[field][obj.user_id])
+        Counters.objects.bulk_update(batch, fields)
+
+
+def reconcile(user_ids=None):
+    """Пересчитать счётчики пользователей и комментариев их постов."""
+    users = User.objects.all()
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    Counters.objects.bulk_create(
+        (Counters(user_id=pk) for pk in users.values_list('pk', flat=True)),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    recount(Counters.objects.filter(user__in=users))
+    # Комментарии лежат в шарде своего поста, так что подзапрос на
+    # каждом шарде видит их все.
+    for alias in settings.SHARD_DATABASES or [DEFAULT_DB_ALIAS]:
+        posts = Post._base_manager.using(alias)
+        if user_ids is not None:
+            posts = posts.filter(author_id__in=user_ids)
+        posts.update(comments_count=count_of(Comment.objects.all(), 'post'))
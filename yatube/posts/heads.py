@@ -0,0 +1,109 @@
+"""Лента подписок, собранная при чтении из «голов» авторов (pull).
+
+Для каждого автора в кэше лежит список ключей ``(pub_date, pk)`` его
+последних ``settings.FEED_HEAD_LENGTH`` постов. Страница ``/follow/``
+получается k-путевым слиянием этих списков через heap и одним
+``in_bulk``, без соединения Follow и Post. Если усечённых голов не
+хватает, чтобы гарантированно заполнить страницу, лента строится
+обычным запросом к базе.
+"""
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.paginator import CursorPaginator, page_number
+
+from .models import Follow, Post
+
+
+def head_key(author_id):
+    return f'posts:head:{author_id}'
+
+
+def build_head(author_id):
+    return list(
+        Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-pk').values_list(
+            'pub_date', 'pk')[:settings.FEED_HEAD_LENGTH]
+    )
+
+
+def refresh(author_id):
+    """Пересчитать голову автора после создания, правки или удаления."""
+    cache.set(
+        head_key(author_id), build_head(author_id),
+        settings.FEED_HEAD_TIMEOUT
+    )
+
+
+def load_heads(author_ids):
+    """Головы авторов из кэша; отсутствующие строятся и кэшируются."""
+    keys = {head_key(author_id): author_id for author_id in author_ids}
+    cached = cache.get_many(keys)
+    missing = {
+        key: build_head(author_id)
+        for key, author_id in keys.items() if key not in cached
+    }
+    if missing:
+        cache.set_many(missing, settings.FEED_HEAD_TIMEOUT)
+    cached.update(missing)
+    return list(cached.values())
+
+
+def merge_keys(heads, skip, count, after=None):
+    """Ключи страницы, слитые из голов, или None, если их не хватает.
+
+    Усечённая голова гарантирует полноту только до своего последнего
+    ключа, поэтому сливаются лишь ключи не старше самого свежего из
+    таких «полов».
+    """
+    floors = [
+        head[-1] for head in heads
+        if len(head) >= settings.FEED_HEAD_LENGTH
+    ]
+    threshold = max(floors) if floors else None
+    merged = heapq.merge(*heads, reverse=True)
+    if after is not None:
+        merged = (key for key in merged if key < after)
+    if threshold is not None:
+        merged = (key for key in merged if key >= threshold)
+    keys = list(islice(merged, skip, skip + count))
+    if len(keys) < count and threshold is not None:
+        return None
+    return keys
+
+
+def feed_page(user, per_page, params):
+    """Страница ленты подписок ``user`` по параметрам запроса."""
+    post_list = Post.objects.filter(
+        author__following__user=user).select_related('author', 'group')
+    paginator = CursorPaginator(post_list, per_page)
+    after = paginator.decode_cursor(params.get('after'))
+    before = paginator.decode_cursor(params.get('before'))
+    number = page_number(params.get('page'))
+    if before is None:
+        author_ids = Follow.objects.filter(user=user).values_list(
+            'author', flat=True)
+        skip = 0 if after else (number - 1) * per_page
+        keys = merge_keys(
+            load_heads(author_ids), skip, per_page + 1, after=after)
+        if keys is not None:
+            posts = Post.objects.select_related('author', 'group').in_bulk(
+                [pk for _, pk in keys])
+            items = [posts[pk] for _, pk in keys if pk in posts]
+            has_previous = after is not None or number > 1
+            return paginator.build_page(
+                items,
+                number=None if after else number,
+                previous_cursor=(
+                    paginator.encode_cursor(paginator.key_of(items[0]))
+                    if has_previous and items else None
+                ),
+            )
+    return paginator.get_page(
+        params.get('page'),
+        after=params.get('after'),
+        before=params.get('before'),
+    )
@@ -0,0 +1,93 @@
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from sorl.thumbnail import default
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from posts import thumbnails
+from posts.models import Post
+
+CACHE_METHODS = ('get', 'get_many', 'set', 'set_many')
+
+
+@contextmanager
+def counting_calls(cache):
+    """Считать обращения к кэшу хранилища миниатюр.
+
+    Вложенные вызовы не считаются: локальный бэкенд реализует
+    ``get_many`` через ``get``, а сетевой сделал бы один запрос.
+    """
+    calls = Counter()
+    depth = [0]
+
+    def counted(method):
+        original = getattr(cache, method)
+
+        def wrapper(*args, **kwargs):
+            if not depth[0]:
+                calls[method] += 1
+            depth[0] += 1
+            try:
+                return original(*args, **kwargs)
+            finally:
+                depth[0] -= 1
+        return wrapper
+
+    for method in CACHE_METHODS:
+        setattr(cache, method, counted(method))
+    try:
+        yield calls
+    finally:
+        for method in CACHE_METHODS:
+            delattr(cache, method)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает число обращений к кэшу и базе при поиске '
+            'миниатюр страницы: по одной на пост и пакетом.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=settings.POSTS_LIM,
+            help='Сколько постов с картинками на странице.'
+        )
+        parser.add_argument(
+            '--size', default='card',
+            help='Размер из settings.POST_THUMBNAILS.'
+        )
+
+    def handle(self, *args, **options):
+        size = options['size']
+        names = list(Post.objects.exclude(image='').order_by(
+            '-pub_date').values_list('image', flat=True)[:options['posts']])
+        if not names:
+            self.stderr.write('Нет постов с картинками')
+            return
+        cache = default.kvstore.cache
+        keys = [
+            add_prefix(thumbnails.thumbnail_file(name, geometry, opts).key)
+            for name in names
+            for _, geometry, opts in thumbnails.variants(size)
+        ]
+        strategies = (
+            ('по одной', lambda: [
+                thumbnails.lookup_many([name], size) for name in names]),
+            ('пакетом', lambda: thumbnails.lookup_many(names, size)),
+        )
+        self.stdout.write(f'Постов с картинками: {len(names)}')
+        for label, run in strategies:
+            cache.delete_many(keys)
+            for state in ('холодный кэш', 'тёплый кэш'):
+                with CaptureQueriesContext(connection) as queries:
+                    with counting_calls(cache) as calls:
+                        run()
+                cache_calls = sum(calls.values())
+                self.stdout.write(
+                    f'{label}, {state}: кэш {cache_calls}, '
+                    f'база {len(queries)}, '
+                    f'всего {cache_calls + len(queries)}'
+                )
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+from posts.signals import post_scopes
+
+
+class Command(BaseCommand):
+    help = 'Нарезает недостающие миниатюры и их варианты для srcset.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько постов проверять за один запрос.'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').select_related(
+            'author', 'group').order_by('pk')
+        last_pk = 0
+        generated = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            names = {post.image.name for post in batch}
+            incomplete = set()
+            for size in settings.POST_THUMBNAILS:
+                found = thumbnails.lookup_many(names, size)
+                expected = len(thumbnails.variants(size))
+                incomplete.update(
+                    name for name in names
+                    if len(found.get(name, {})) < expected
+                )
+            for post in batch:
+                if post.image.name in incomplete:
+                    thumbnails.generate(post.image.name, post_scopes(post))
+                    generated += 1
+        self.stdout.write(f'Нарезано картинок: {generated}')
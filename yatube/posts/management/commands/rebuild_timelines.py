@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import sharding
+from posts import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help='Пользователи; по умолчанию все, у кого есть подписки.'
+        )
+
+    def handle(self, *args, **options):
+        if sharding.enabled():
+            # Timeline с шардами не ведётся (см. posts.E001), а JOIN в
+            # rebuild увидел бы посты только из default.
+            raise CommandError(
+                'С SHARD_DATABASES ленты собираются из голов авторов, '
+                'Timeline не используется.')
+        users = User.objects.filter(follower__isnull=False).distinct()
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        user_ids = list(users.values_list('pk', flat=True))
+        timeline.rebuild(user_ids)
+        self.stdout.write(f'Пересобрано лент: {len(user_ids)}')
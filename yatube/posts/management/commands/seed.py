@@ -0,0 +1,234 @@
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from posts import caching, timeline
+from posts.models import Comment, Counters, Follow, Group, Post
+
+User = get_user_model()
+
+TEXT_POOL = 500
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса рангов 1..count по закону Ципфа."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, count + 1)
+    ))
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+@contextmanager
+def manual_dates(*fields):
+    """Временно выключить ``auto_now_add``, чтобы задать даты самим."""
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками с перекосом как в бою.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=30)
+        parser.add_argument('--posts', type=int, default=20000)
+        parser.add_argument('--comments', type=int, default=50000)
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько последних дней раскидать даты постов.'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Одинаковый seed даёт одинаковые данные.'
+        )
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.monotonic()
+        with transaction.atomic(), manual_dates(
+            Post._meta.get_field('pub_date'),
+            Comment._meta.get_field('created'),
+        ):
+            user_ids = self.create_users(options['users'])
+            group_ids = self.create_groups(options['groups'])
+            follows = self.create_follows(user_ids, options['follows'])
+            posts_count, comments_count = self.create_posts(
+                user_ids, group_ids, options)
+            Counters.objects.bulk_create(
+                (Counters(
+                    user_id=user_id,
+                    posts_count=posts_count[user_id],
+                    followers_count=follows['followers'][user_id],
+                    following_count=follows['following'][user_id],
+                ) for user_id in user_ids),
+            )
+        if settings.FOLLOW_FEED == 'timeline':
+            # Одна транзакция вместо коммита на каждую ленту.
+            with transaction.atomic():
+                timeline.rebuild(sorted(follows['following']))
+        caching.bump(caching.GLOBAL)
+        self.stdout.write(
+            f'Создано: пользователей {len(user_ids)}, '
+            f'групп {len(group_ids)}, постов {options["posts"]}, '
+            f'комментариев {comments_count}, '
+            f'подписок {follows["total"]} '
+            f'за {time.monotonic() - started:.1f} с'
+        )
+
+    def insert(self, model, objects):
+        # Размер одного INSERT Django подбирает сам под лимиты SQLite;
+        # batch_size лишь ограничивает число объектов в памяти.
+        for batch in chunked(objects, self.batch_size):
+            model.objects.bulk_create(batch)
+
+    def popularity(self, ids, exponent):
+        """Случайно перемешанные id и накопленные веса их популярности."""
+        ranked = list(ids)
+        self.rng.shuffle(ranked)
+        return ranked, zipf_weights(len(ranked), exponent)
+
+    def create_users(self, count):
+        first = next_pk(User)
+        names = [
+            (self.fake.user_name(), self.fake.first_name(),
+             self.fake.last_name())
+            for _ in range(min(count, TEXT_POOL))
+        ]
+        password = make_password(None)
+        joined = timezone.now()
+
+        def users():
+            for pk in range(first, first + count):
+                username, first_name, last_name = self.rng.choice(names)
+                yield User(
+                    pk=pk, username=f'{username}_{pk}', password=password,
+                    first_name=first_name, last_name=last_name,
+                    date_joined=joined,
+                )
+        self.insert(User, users())
+        return list(range(first, first + count))
+
+    def create_groups(self, count):
+        first = next_pk(Group)
+        self.insert(Group, (
+            Group(
+                pk=pk,
+                title=self.fake.sentence(nb_words=3)[:200],
+                slug=f'group-{pk}',
+                description=self.fake.paragraph(),
+            )
+            for pk in range(first, first + count)
+        ))
+        return list(range(first, first + count))
+
+    def create_follows(self, user_ids, count):
+        """Подписки со степенным распределением числа подписчиков."""
+        authors, weights = self.popularity(user_ids, exponent=1.1)
+        edges = set()
+        attempts = 0
+        while len(edges) < count and attempts < count * 3:
+            attempts += 1
+            user_id = self.rng.choice(user_ids)
+            author_id = self.rng.choices(authors, cum_weights=weights)[0]
+            if user_id != author_id:
+                edges.add((user_id, author_id))
+        edges = sorted(edges)
+        self.insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in edges
+        ))
+        return {
+            'total': len(edges),
+            'followers': Counter(author for _, author in edges),
+            'following': Counter(user for user, _ in edges),
+        }
+
+    def create_posts(self, user_ids, group_ids, options):
+        """Посты активных авторов в горячих группах и комментарии к ним."""
+        count = options['posts']
+        authors, author_weights = self.popularity(user_ids, exponent=1.0)
+        groups, group_weights = self.popularity(group_ids, exponent=1.2)
+        now = timezone.now()
+        span = options['days'] * 24 * 60 * 60
+        ages = [self.rng.uniform(0, span) for _ in range(count)]
+        texts = [
+            self.fake.paragraph(nb_sentences=self.rng.randint(1, 6))
+            for _ in range(TEXT_POOL)
+        ]
+        first = next_pk(Post)
+        post_ids, post_weights = self.popularity(
+            range(first, first + count), exponent=0.9)
+        commented = self.rng.choices(
+            post_ids, cum_weights=post_weights, k=options['comments']
+        ) if count else []
+        comments_count = Counter(commented)
+        posts_count = Counter()
+
+        def posts():
+            for index, age in enumerate(ages):
+                author_id = self.rng.choices(
+                    authors, cum_weights=author_weights)[0]
+                posts_count[author_id] += 1
+                group_id = None
+                if group_ids and self.rng.random() < 0.7:
+                    group_id = self.rng.choices(
+                        groups, cum_weights=group_weights)[0]
+                yield Post(
+                    pk=first + index,
+                    text=self.rng.choice(texts),
+                    author_id=author_id,
+                    group_id=group_id,
+                    pub_date=now - timedelta(seconds=age),
+                    comments_count=comments_count[first + index],
+                )
+        self.insert(Post, posts())
+
+        phrases = [self.fake.sentence() for _ in range(TEXT_POOL)]
+
+        def comments():
+            for post_id in commented:
+                age = ages[post_id - first]
+                yield Comment(
+                    post_id=post_id,
+                    author_id=self.rng.choice(user_ids),
+                    text=self.rng.choice(phrases),
+                    created=now - timedelta(
+                        seconds=self.rng.uniform(0, age)),
+                )
+        self.insert(Comment, comments())
+        return posts_count, len(commented)
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.16 on 2026-10-17 06:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_of(model, field, db):
+    counted = model.objects.using(db).filter(**{field: OuterRef('pk')}).order_by(
+    ).values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(counted), Value(0))
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    Counters = apps.get_model('posts', 'Counters')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    db = schema_editor.connection.alias
+    Counters.objects.using(db).bulk_create(
+        Counters(user_id=pk)
+        for pk in User.objects.using(db).values_list('pk', flat=True)
+    )
+    Counters.objects.using(db).update(
+        posts_count=count_of(Post, 'author', db),
+        followers_count=count_of(Follow, 'author', db),
+        following_count=count_of(Follow, 'user', db),
+    )
+    Post.objects.using(db).update(
+        comments_count=count_of(Comment, 'post', db))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0007_timeline'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
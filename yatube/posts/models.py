@@ -2,10 +2,14 @@ from django.db import models
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
+from core.sharding import ShardedModel
+
 User = get_user_model()
 
 
-class Post(models.Model):
+class Post(ShardedModel):
+    shard_by = 'author'
+
     text = models.TextField(
         verbose_name='Текст поста',
         help_text='Текст нового поста'
@@ -14,6 +18,10 @@ class Post(models.Model):
         verbose_name='Дата публикации',
         auto_now_add=True
     )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -32,10 +40,30 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев',
+        default=0,
+        editable=False
+    )
 
     class Meta:
         default_related_name = 'posts'
         ordering = ['-pub_date']
+        # Порядок лент и курсоров — (pub_date, id) по убыванию.
+        indexes = (
+            models.Index(
+                name='post_date_idx',
+                fields=['-pub_date', '-id'],
+            ),
+            models.Index(
+                name='post_author_date_idx',
+                fields=['author', '-pub_date', '-id'],
+            ),
+            models.Index(
+                name='post_group_date_idx',
+                fields=['group', '-pub_date', '-id'],
+            ),
+        )
 
     def __str__(self):
         return self.text[:settings.TEXT_POSTS_LIM]
@@ -50,7 +78,10 @@ class Group(models.Model):
         return self.title
 
 
-class Comment(models.Model):
+class Comment(ShardedModel):
+    # Комментарии живут в шарде поста.
+    shard_by = 'post'
+
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -72,11 +103,23 @@ class Comment(models.Model):
         auto_now_add=True
     )
 
+    class Meta:
+        ordering = ['created', 'pk']
+        indexes = (
+            models.Index(
+                name='comment_post_created_idx',
+                fields=['post', 'created'],
+            ),
+        )
+
     def __str__(self):
         return self.text[:settings.TEXT_POSTS_LIM]
 
 
-class Follow(models.Model):
+class Follow(ShardedModel):
+    # Рядом с постами автора: лента собирается по его шарду.
+    shard_by = 'author'
+
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -97,3 +140,69 @@ class Follow(models.Model):
                 fields=['user', 'author'],
             ),
         )
+        # (user, author) покрывает уникальное ограничение, обратный
+        # порядок нужен раскладке по подписчикам автора.
+        indexes = (
+            models.Index(
+                name='follow_author_user_idx',
+                fields=['author', 'user'],
+            ),
+        )
+
+
+class Timeline(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации'
+    )
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        constraints = (
+            models.UniqueConstraint(
+                name='unique_timeline_entry',
+                fields=['user', 'post'],
+            ),
+        )
+        indexes = (
+            models.Index(
+                name='timeline_user_date_idx',
+                fields=['user', '-pub_date', '-post'],
+            ),
+        )
+
+
+class Counters(models.Model):
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0
+    )
+
+    def __str__(self):
+        return f'Счётчики {self.user_id}'
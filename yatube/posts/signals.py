@@ -0,0 +1,164 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import caching, counters, heads, timeline
+from .models import Comment, Counters, Follow, Group, Post
+
+User = get_user_model()
+
+
+def uses_timeline():
+    return settings.FOLLOW_FEED == 'timeline'
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and uses_timeline():
+        timeline.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def refresh_author_head(sender, instance, raw=False, **kwargs):
+    if not raw and settings.FOLLOW_FEED == 'heads':
+        heads.refresh(instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and uses_timeline():
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    if uses_timeline():
+        timeline.prune(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def create_counters(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Counters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_comments(
+            instance.post_id, 1, using=instance._state.db)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.bump_comments(
+        instance.post_id, -1, using=instance._state.db)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        counters.bump_user(instance.author_id, followers_count=1)
+        counters.bump_user(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.bump_user(instance.author_id, followers_count=-1)
+    counters.bump_user(instance.user_id, following_count=-1)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Group)
+@receiver(pre_save, sender=User)
+def remember_page_scopes(sender, instance, raw=False, **kwargs):
+    """Запомнить группу и имена до сохранения: их страницы тоже устарели."""
+    if raw or instance.pk is None:
+        return
+    field = {Post: 'group__slug', Group: 'slug', User: 'username'}[sender]
+    instance._old_scope_name = sender.objects.filter(
+        pk=instance.pk).values_list(field, flat=True).first()
+
+
+def post_scopes(post):
+    scopes = [
+        caching.GLOBAL,
+        ('author', post.author.username),
+        ('post', str(post.pk)),
+    ]
+    if post.group_id:
+        scopes.append(('group', post.group.slug))
+    old_group = getattr(post, '_old_scope_name', None)
+    if old_group:
+        scopes.append(('group', old_group))
+    return scopes
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump(*post_scopes(instance))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_group_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump(
+            caching.GLOBAL,
+            ('group', instance.slug),
+            ('group', getattr(instance, '_old_scope_name', None) or ''),
+        )
+
+
+@receiver(post_save, sender=User)
+def bump_author_pages(sender, instance, created, raw=False,
+                      update_fields=None, **kwargs):
+    if raw or created or update_fields == frozenset({'last_login'}):
+        return
+    old_username = getattr(instance, '_old_scope_name', None) or ''
+    groups = Group.objects.filter(posts__author=instance).values_list(
+        'slug', flat=True).distinct()
+    # Имя комментатора выводится на страницах прокомментированных постов.
+    commented = Comment.objects.filter(author=instance).values_list(
+        'post_id', flat=True).distinct()
+    caching.bump(
+        caching.GLOBAL,
+        ('author', instance.username),
+        ('author', old_username),
+        *(('group', slug) for slug in groups),
+        *(('post', str(post_id)) for post_id in commented)
+    )
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follow_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        # Профиль подписчика тоже меняется: на нём число его подписок.
+        caching.bump(
+            ('author', instance.author.username),
+            ('author', instance.user.username),
+            ('follows', str(instance.user_id)),
+        )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_pages(sender, instance, raw=False, **kwargs):
+    if not raw:
+        caching.bump(('post', str(instance.post_id)))
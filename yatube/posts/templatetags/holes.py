@@ -0,0 +1,75 @@
+import json
+
+from django import template
+from django.template.base import token_kwargs
+from django.utils.http import urlsafe_base64_encode
+
+from posts.forms import CommentForm
+from posts.models import Follow
+
+register = template.Library()
+
+
+def marker(template_name, params):
+    payload = json.dumps(
+        {'template': template_name, 'params': params},
+        separators=(',', ':'),
+    )
+    return '<!--hole:%s-->' % urlsafe_base64_encode(payload.encode())
+
+
+def plain(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class HoleNode(template.Node):
+    def __init__(self, template_name, params):
+        self.template_name = template_name
+        self.params = params
+
+    def render(self, context):
+        template_name = self.template_name.resolve(context)
+        params = {
+            key: plain(value.resolve(context))
+            for key, value in self.params.items()
+        }
+        if getattr(context.get('request'), 'punch_holes', False):
+            return marker(template_name, params)
+        hole = context.template.engine.get_template(template_name)
+        with context.push(**params):
+            return hole.render(context)
+
+
+@register.tag
+def hole(parser, token):
+    """Персональный фрагмент страницы: ``{% hole "name.html" key=value %}``.
+
+    Обычно работает как ``include``. При сборке кэшируемого каркаса
+    страницы вместо фрагмента выводится метка с именем шаблона и
+    параметрами, а сам фрагмент рендерится на каждый запрос.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(
+            '%r tag takes a template name' % bits[0])
+    params = token_kwargs(bits[2:], parser)
+    if len(params) != len(bits) - 2:
+        raise template.TemplateSyntaxError(
+            '%r tag accepts only key=value arguments' % bits[0])
+    return HoleNode(parser.compile_filter(bits[1]), params)
+
+
+@register.simple_tag(takes_context=True)
+def is_following(context, author_id):
+    user = context['user']
+    return user.is_authenticated and Follow.objects.filter(
+        user=user, author_id=author_id).exists()
+
+
+@register.simple_tag(takes_context=True)
+def comment_form(context):
+    """Форма комментария из контекста страницы или пустая, если фрагмент
+    рендерится отдельно: в метку попадают только простые значения."""
+    return context.get('form') or CommentForm()
@@ -0,0 +1,21 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, size='card'):
+    """Миниатюра поста, если она готова, иначе оригинал в её размерах.
+
+    Изображение при рендере не открывается. Найденное заранее
+    ``thumbnails.prefetch`` берётся из ``post.previews``.
+    """
+    if not post.image:
+        return None
+    previews = getattr(post, 'previews', {})
+    if size in previews:
+        return previews[size]
+    images = thumbnails.lookup_many([post.image.name], size)
+    return thumbnails.preview(post, size, images.get(post.image.name, {}))
@@ -0,0 +1,51 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..models import Comment, Counters, Follow, Group, Post
+
+User = get_user_model()
+
+SEED_OPTIONS = {
+    'users': 30, 'groups': 4, 'posts': 120, 'comments': 200,
+    'follows': 80, 'seed': 7, 'stdout': StringIO(),
+}
+
+
+class SeedCommandTest(TestCase):
+    def snapshot(self):
+        return list(Post.objects.order_by('pk').values_list(
+            'pk', 'author__username', 'group__slug', 'text', 'pub_date'))
+
+    def test_seed_counts_and_counters(self):
+        """Команда создаёт данные и согласованные счётчики."""
+        call_command('seed', **SEED_OPTIONS)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 4)
+        self.assertEqual(Post.objects.count(), 120)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertLessEqual(Follow.objects.count(), 80)
+        author_id = Post.objects.values_list('author', flat=True).first()
+        self.assertEqual(
+            Counters.objects.get(user_id=author_id).posts_count,
+            Post.objects.filter(author_id=author_id).count()
+        )
+        post = Post.objects.order_by('-comments_count').first()
+        self.assertEqual(post.comments_count, post.comments.count())
+        self.assertFalse(
+            Comment.objects.filter(created__lt=post.pub_date, post=post)
+            .exists()
+        )
+
+    def test_seed_deterministic(self):
+        """Одинаковый seed даёт одинаковые данные."""
+        call_command('seed', **SEED_OPTIONS)
+        first = self.snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        call_command('seed', **SEED_OPTIONS)
+        second = self.snapshot()
+        self.assertEqual(
+            [row[:4] for row in first], [row[:4] for row in second])
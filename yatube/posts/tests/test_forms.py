@@ -1,23 +1,63 @@
+import os
 import shutil
+import struct
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
 from os.path import basename
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
 from django.urls import reverse
+from PIL import Image
 
+from core import transactions
+from core.nplusone import QueryAuditMixin
+
+from .. import uploads
 from ..models import Comment, Group, Post
 
 User = get_user_model()
 
+ORIENTATION = 0x0112
+
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+def jpeg(color, size, **options):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG', **options)
+    return buffer.getvalue()
+
+
+def mpo(frames):
+    """Склеить JPEG-кадры в MPO: индекс MPF в APP2 первого кадра."""
+    count = len(frames)
+    header = b'MM\x00*' + struct.pack('>LH', 8, 3)
+    header += struct.pack('>HHL', 0xB000, 7, 4) + b'0100'
+    header += struct.pack('>HHLL', 0xB001, 4, 1, count)
+    header += struct.pack('>HHLL', 0xB002, 7, 16 * count, 50)
+    header += struct.pack('>L', 0)
+    length = 2 + 4 + len(header) + 16 * count
+    # Смещения кадров считаются от заголовка MPF: SOI, APP2 и 'MPF\0'.
+    first = len(frames[0]) + 2 + length
+    offset = first - 10
+    entries = struct.pack('>LLLHH', 0x20030000, first, 0, 0, 0)
+    for frame in frames[1:]:
+        entries += struct.pack('>LLLHH', 0x020002, len(frame), offset, 0, 0)
+        offset += len(frame)
+    segment = b'\xff\xe2' + struct.pack('>H', length) + b'MPF\x00'
+    return (frames[0][:2] + segment + header + entries + frames[0][2:]
+            + b''.join(frames[1:]))
+
+
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
-class PostFormTests(TestCase):
+class PostFormTests(QueryAuditMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -78,6 +118,58 @@ class PostFormTests(TestCase):
         self.assertEqual(basename(last_post.image.file.name),
                          form_data['image'].name)
 
+    @override_settings(POST_IMAGE_MAX_SIZE=200)
+    def test_uploaded_image_normalized(self):
+        """Загруженный JPEG повёрнут по EXIF, ужат и без метаданных."""
+        exif = Image.Exif()
+        exif[ORIENTATION] = 6
+        buffer = BytesIO()
+        Image.new('RGB', (300, 100)).save(buffer, 'JPEG', exif=exif)
+        uploaded = SimpleUploadedFile(
+            name='photo.jpg',
+            content=buffer.getvalue(),
+            content_type='image/jpeg'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото', 'image': uploaded},
+        )
+        post = Post.objects.first()
+        self.assertEqual(basename(post.image.name), 'photo.jpg')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (67, 200))
+            self.assertNotIn(ORIENTATION, image.getexif())
+
+    @override_settings(POST_IMAGE_MAX_SIZE=200)
+    def test_uploaded_mpo_normalized(self):
+        """Снимок MPO сохраняется первым кадром в JPEG, повёрнутым по EXIF."""
+        exif = Image.Exif()
+        exif[ORIENTATION] = 6
+        content = mpo([
+            jpeg('red', (300, 100), exif=exif),
+            jpeg('blue', (50, 50)),
+        ])
+        with Image.open(BytesIO(content)) as image:
+            self.assertEqual(image.format, 'MPO')
+            self.assertTrue(image.is_animated)
+        uploaded = SimpleUploadedFile(
+            name='phone.jpg',
+            content=content,
+            content_type='image/jpeg'
+        )
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Снимок', 'image': uploaded},
+        )
+        post = Post.objects.first()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (67, 200))
+            self.assertNotIn(ORIENTATION, image.getexif())
+            red, green, blue = image.getpixel((33, 100))
+            self.assertGreater(red, blue)
+
     def test_edit_post(self):
         """Валидная форма редактирует запись в Post."""
         posts_count = Post.objects.count()
@@ -153,3 +245,51 @@ class PostFormTests(TestCase):
         )
         self.assertEqual(Comment.objects.count(), comment_count)
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+@override_settings(
+    MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0, QUERY_AUDIT=None)
+class PostWriteLockTest(TransactionTestCase):
+    # Настоящий BEGIN IMMEDIATE и повтор вне транзакции TestCase.
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    @mock.patch('core.transactions.time.sleep')
+    def test_image_processed_outside_write_lock(self, sleep):
+        """Картинка обрабатывается без блокировки записи, а повтор
+        занятой транзакции не пишет файл заново."""
+        client = Client()
+        client.force_login(User.objects.create_user(username='author'))
+        locked = []
+        normalize = uploads.normalize
+
+        def watched(upload):
+            locked.append(
+                transactions._write_locks[DEFAULT_DB_ALIAS].locked())
+            return normalize(upload)
+        inserts = []
+
+        def busy_once(execute, sql, params, many, context):
+            if sql.startswith('INSERT INTO "posts_post"'):
+                inserts.append(sql)
+                if len(inserts) == 1:
+                    raise OperationalError('database is locked')
+            return execute(sql, params, many, context)
+        buffer = BytesIO()
+        Image.new('RGB', (30, 10)).save(buffer, 'JPEG')
+        uploaded = SimpleUploadedFile(
+            'locked.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with mock.patch('posts.uploads.normalize', watched), \
+                connection.execute_wrapper(busy_once):
+            client.post(
+                reverse('posts:post_create'),
+                data={'text': 'Фото', 'image': uploaded},
+            )
+        self.assertEqual(locked, [False])
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(
+            os.listdir(os.path.join(TEMP_MEDIA_ROOT, 'posts')),
+            ['locked.jpg'])
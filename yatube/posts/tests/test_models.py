@@ -1,8 +1,12 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
 from django.conf import settings
 
-from ..models import Group, Post, Comment
+from ..models import Comment, Counters, Follow, Group, Post
 
 User = get_user_model()
 
@@ -112,3 +116,71 @@ class CommentModelTest(TestCase):
                     comment._meta.get_field(field).help_text,
                     expected_value
                 )
+
+
+class CountersModelTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(text='текст', author=cls.author)
+
+    def counters(self, user):
+        return Counters.objects.get(user=user)
+
+    def test_counters_follow_signals(self):
+        """Счётчики меняются при постах, комментариях и подписках."""
+        Comment.objects.create(
+            text='комментарий', author=self.reader, post=self.post)
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(self.counters(self.author).posts_count, 1)
+        self.assertEqual(self.counters(self.author).followers_count, 1)
+        self.assertEqual(self.counters(self.reader).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.counters(self.author).followers_count, 0)
+        self.assertEqual(self.counters(self.reader).following_count, 0)
+
+    def test_reconcile_counters(self):
+        """reconcile_counters выравнивает разошедшиеся счётчики."""
+        Counters.objects.update(posts_count=42, followers_count=7)
+        Post.objects.update(comments_count=3)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(self.counters(self.author).posts_count, 1)
+        self.assertEqual(self.counters(self.author).followers_count, 0)
+
+    def test_drifted_counters_do_not_block_deletes(self):
+        """Удаление при обнулённом разошедшемся счётчике не падает."""
+        post = Post.objects.create(text='пост', author=self.author)
+        comment = Comment.objects.create(
+            text='комментарий', author=self.reader, post=post)
+        Post.objects.update(comments_count=0)
+        Counters.objects.update(posts_count=0)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        Comment.objects.create(text='ещё', author=self.reader, post=post)
+        Post.objects.update(comments_count=0)
+        post.delete()
+        self.assertEqual(self.counters(self.author).posts_count, 0)
+
+    def test_missing_counters_restored(self):
+        """Пользователю из bulk_create строка счётчиков создаётся
+        при первом изменении или чтении, с подсчётом по данным."""
+        User.objects.bulk_create([
+            User(username='bulk'), User(username='lazy')])
+        bulk = User.objects.get(username='bulk')
+        Post.objects.create(text='первый', author=bulk)
+        self.assertEqual(self.counters(bulk).posts_count, 1)
+        lazy = User.objects.get(username='lazy')
+        Follow.objects.create(user=lazy, author=self.author)
+        Counters.objects.filter(user=lazy).delete()
+        response = self.client.get(reverse('posts:profile', args=['lazy']))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(lazy).following_count, 1)
+        response = self.client.get(reverse('api:user_detail', args=['bulk']))
+        self.assertEqual(response.json()['posts_count'], 1)
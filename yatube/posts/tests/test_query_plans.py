@@ -0,0 +1,119 @@
+import re
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Counters, Group, Post
+
+User = get_user_model()
+
+# Полный проход таблицы (не по индексу) и сортировка во временном дереве.
+BAD_PLAN_RE = re.compile(
+    r'^SCAN (?!.*\bUSING (?:COVERING )?INDEX\b)(?!CONSTANT ROW)|'
+    r'USE TEMP B-TREE'
+)
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+# Таблицы, которые представления читают целиком намеренно: список групп
+# в форме поста.
+WHOLE_TABLE_READS = ('SCAN posts_group',)
+
+
+def query_plan(sql):
+    # captured_queries хранит SQL с уже подставленными значениями.
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+@override_settings(QUERY_AUDIT=None)
+class QueryPlanTest(TestCase):
+    """Планы всех запросов представлений posts на засеянной базе."""
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'seed', users=60, groups=5, posts=600, comments=600,
+            follows=300, stdout=StringIO(),
+        )
+        cls.group = Group.objects.order_by('pk').first()
+        cls.post = Post.objects.select_related('author').order_by(
+            '-comments_count', '-pk').first()
+        counters = Counters.objects.select_related('user')
+        cls.author = counters.order_by('-posts_count').first().user
+        cls.reader = counters.exclude(user=cls.author).order_by(
+            '-following_count').first().user
+
+    def requests(self):
+        """Все представления posts, включая вторые страницы курсоров."""
+        index = reverse('posts:index')
+        group = reverse('posts:group_list', args=[self.group.slug])
+        profile = reverse('posts:profile', args=[self.author.username])
+        detail = reverse('posts:post_detail', args=[self.post.pk])
+        follow = reverse('posts:follow_index')
+        return [
+            (None, 'get', index, None),
+            (None, 'get', index, {'page': 3}),
+            (None, 'get', group, None),
+            (None, 'get', group, {'page': 2}),
+            (self.reader, 'get', profile, None),
+            (self.reader, 'get', profile, {'page': 2}),
+            (self.reader, 'get', detail, None),
+            (None, 'get', reverse('posts:post_comments', args=[
+                self.post.pk]), None),
+            (self.reader, 'get', follow, None),
+            (self.reader, 'get', follow, {'page': 2}),
+            (self.author, 'get', reverse('posts:post_create'), None),
+            (self.author, 'post', reverse('posts:post_create'),
+             {'text': 'план', 'group': self.group.pk}),
+            (self.post.author, 'post', reverse(
+                'posts:post_edit', args=[self.post.pk]),
+             {'text': 'план', 'group': ''}),
+            (self.reader, 'post', reverse(
+                'posts:add_comment', args=[self.post.pk]), {'text': 'план'}),
+            (self.reader, 'get', reverse(
+                'posts:profile_follow', args=[self.author.username]), None),
+            (self.reader, 'get', reverse(
+                'posts:profile_unfollow', args=[self.author.username]),
+             None),
+        ]
+
+    def assert_plans(self, requests):
+        for user, method, url, data in requests:
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                getattr(client, method)(url, data)
+            for query in queries.captured_queries:
+                sql = query['sql']
+                if not sql.startswith(EXPLAINED):
+                    continue
+                with self.subTest(url=url, data=data, sql=sql[:120]):
+                    plan = query_plan(sql)
+                    bad = [
+                        step for step in plan
+                        if BAD_PLAN_RE.search(step)
+                        and step not in WHOLE_TABLE_READS
+                    ]
+                    self.assertEqual(bad, [], '\n'.join(plan))
+
+    def test_no_full_scans_or_temp_sorts(self):
+        """Ни один запрос представлений не сканирует таблицу целиком и
+        не сортирует во временном B-дереве."""
+        self.assert_plans(self.requests())
+
+    @override_settings(FOLLOW_FEED='heads')
+    def test_heads_feed_plans(self):
+        """Лента из голов авторов тоже читается по индексам."""
+        follow = reverse('posts:follow_index')
+        self.assert_plans([
+            (self.reader, 'get', follow, None),
+            (self.reader, 'get', follow, {'page': 2}),
+        ])
@@ -3,12 +3,14 @@ from http import HTTPStatus
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase
 
+from core.nplusone import QueryAuditMixin
+
 from ..models import Group, Post
 
 User = get_user_model()
 
 
-class PostURLTests(TestCase):
+class PostURLTests(QueryAuditMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -1,15 +1,21 @@
 import shutil
 import tempfile
+from http import HTTPStatus
 
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Group, Post, Follow
+from core.nplusone import QueryAuditMixin
+
+from .. import caching, thumbnails
+from ..models import Comment, Group, Post, Follow, Timeline
 
 User = get_user_model()
 
@@ -17,7 +23,7 @@ TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
-class ViewsTests(TestCase):
+class ViewsTests(QueryAuditMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -142,23 +148,306 @@ class ViewsTests(TestCase):
             self.post, response.context['page_obj']
         )
 
-    def test_cache_index_page(self):
-        """Проверка работы кэша"""
-        Post.objects.create(
-            author=self.user,
-            text='Текст кэша',
+    @override_settings(THUMBNAIL_WORKERS=0)
+    def test_thumbnail_not_rendered_in_request(self):
+        """Пока миниатюры нет, выводится оригинал в её размерах,
+        а после нарезки — миниатюра со srcset."""
+        url = reverse('posts:index')
+        response = self.authorized_client.get(url)
+        self.assertContains(response, self.post.image.url)
+        self.assertContains(response, 'width="960" height="339"')
+        thumbnails.enqueue(self.post.image.name, [caching.GLOBAL])
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, self.post.image.url)
+        self.assertContains(response, settings.MEDIA_URL + 'cache/')
+        self.assertContains(response, 'type="image/jpeg"')
+        self.assertContains(response, ' 480w, ')
+
+    def test_thumbnails_prefetched_for_page(self):
+        """Миниатюры страницы ищутся одним запросом к базе."""
+        thumbnails.generate(self.post.image.name)
+        names = [self.post.image.name, 'posts/missing.gif']
+        cache.clear()
+        with self.assertNumQueries(1):
+            found = thumbnails.lookup_many(names, 'card')
+        self.assertEqual(list(found), [self.post.image.name])
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                list(thumbnails.lookup_many(names, 'card')),
+                [self.post.image.name]
+            )
+
+    def test_post_card_cache(self):
+        """Карточка поста кэшируется до изменения самого поста."""
+        url = reverse('posts:index')
+        self.authorized_client.get(url)
+        Post.objects.filter(pk=self.post.pk).update(text='Мимо кэша')
+        response = self.authorized_client.get(url)
+        self.assertNotContains(response, 'Мимо кэша')
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Отредактированный текст'
+        post.save()
+        for page in (url, reverse('posts:profile', args=[self.user])):
+            with self.subTest(page=page):
+                response = self.authorized_client.get(page)
+                self.assertContains(response, 'Отредактированный текст')
+
+
+class PageCacheTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(
+            title='заголовок',
+            description='описание',
+            slug='page_cache',
         )
-        response = self.authorized_client.get(reverse('posts:index'))
-        post = response.content
-        Post.objects.filter(text='Текст кэша').delete()
-        response = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(post, response.content)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=[cls.group.slug]),
+            reverse('posts:profile', args=[cls.user.username]),
+        )
+
+    def setUp(self):
         cache.clear()
-        response_clear = self.authorized_client.get(reverse('posts:index'))
-        self.assertNotEqual(response_clear.content, response.content)
+        self.guest_client = Client()
+
+    def test_anonymous_pages_cached(self):
+        """Повторный анонимный запрос не ходит в базу."""
+        Post.objects.create(text='пост', author=self.user, group=self.group)
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.guest_client.get(url)
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(url)
+                self.assertContains(response, 'пост')
+
+    def test_unknown_params_share_cache_entry(self):
+        """Лишние параметры запроса не создают новых записей кэша."""
+        Post.objects.create(text='пост', author=self.user)
+        url = reverse('posts:index')
+        self.guest_client.get(url, {'x': 1})
+        for params in ({'x': 2}, {'utm': 'mail', 'y': ''}, {}):
+            with self.subTest(params=params):
+                with self.assertNumQueries(0):
+                    self.guest_client.get(url, params)
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(url, {'page': 2})
+        self.assertTrue(queries.captured_queries)
+
+    def test_invalid_params_not_cached(self):
+        """Мусорные курсоры и номера страниц не кэшируются, а разные
+        записи одной страницы делят запись кэша."""
+        Post.objects.create(text='пост', author=self.user)
+        url = reverse('posts:index')
+        for params in ({'after': 'мусор'}, {'after': 'WzEsMl0'},
+                       {'page': 'abc'}, {'page': -1}):
+            with self.subTest(params=params):
+                for _ in range(2):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = self.guest_client.get(url, params)
+                    self.assertTrue(queries.captured_queries)
+                self.assertNotIn('ETag', response)
+        self.guest_client.get(url, {'page': '1'})
+        with self.assertNumQueries(0):
+            self.guest_client.get(url, {'page': '01'})
+
+    def test_writes_bump_generations(self):
+        """Создание, правка и удаление поста сбрасывают страницы."""
+        for url in self.urls:
+            self.guest_client.get(url)
+        post = Post.objects.create(
+            text='новый пост', author=self.user, group=self.group)
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'новый пост')
+        post.text = 'правка'
+        post.save()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), 'правка')
+        post.delete()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertNotContains(self.guest_client.get(url), 'правка')
+
+    def test_conditional_get(self):
+        """Совпавший ETag получает 304 без запросов к базе."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                etag = self.guest_client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(
+                        url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+        etags = [self.guest_client.get(url)['ETag'] for url in self.urls]
+        Post.objects.create(text='пост', author=self.user, group=self.group)
+        for url, etag in zip(self.urls, etags):
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_follow_feed_conditional_get(self):
+        """ETag ленты меняется с подписками и постами авторов."""
+        reader = User.objects.create_user(username='follower')
+        client = Client()
+        client.force_login(reader)
+        url = reverse('posts:follow_index')
+        etag = client.get(url)['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Follow.objects.create(user=reader, author=self.user)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        Post.objects.create(text='пост', author=self.user)
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'пост')
+
+    def test_follow_bumps_follower_profile(self):
+        """Подписка и отписка меняют профиль самого подписчика."""
+        reader = User.objects.create_user(username='profile_reader')
+        url = reverse('posts:profile', args=[reader.username])
+        self.assertContains(self.guest_client.get(url), 'подписок: 0')
+        follow = Follow.objects.create(user=reader, author=self.user)
+        self.assertContains(self.guest_client.get(url), 'подписок: 1')
+        follow.delete()
+        self.assertContains(self.guest_client.get(url), 'подписок: 0')
+
+    def test_skeleton_shared_between_users(self):
+        """Каркас страницы общий, персональные фрагменты — свои."""
+        post = Post.objects.create(text='пост', author=self.user)
+        reader = User.objects.create_user(username='reader')
+        author_client = Client()
+        author_client.force_login(self.user)
+        reader_client = Client()
+        reader_client.force_login(reader)
+        url = reverse('posts:post_detail', args=[post.pk])
+        edit_url = reverse('posts:post_edit', args=[post.pk])
+        response = author_client.get(url)
+        self.assertContains(response, edit_url)
+        self.assertContains(response, 'author</b>')
+        response = reader_client.get(url)
+        self.assertNotContains(response, edit_url)
+        self.assertContains(response, 'reader</b>')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotIn('post', response.context)
+        self.assertNotContains(response, '<!--hole:')
+        self.assertContains(response, 'class="form-control"')
+        self.assertContains(response, 'Всего постов автора: 1')
+        Post.objects.create(text='второй', author=self.user)
+        response = reader_client.get(url)
+        self.assertContains(response, 'Всего постов автора: 2')
+
+    def test_comment_bumps_post_page(self):
+        """Новый комментарий сразу виден на странице поста."""
+        post = Post.objects.create(text='пост', author=self.user)
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('posts:post_detail', args=[post.pk])
+        client.get(url)
+        client.post(
+            reverse('posts:add_comment', args=[post.pk]),
+            {'text': 'свежий комментарий'}
+        )
+        self.assertContains(client.get(url), 'свежий комментарий')
+
+    def test_post_page_follows_related_rows(self):
+        """Страница поста и её ETag обновляются после правки автора,
+        группы и комментатора."""
+        author = User.objects.create_user(username='renamed')
+        post = Post.objects.create(
+            text='пост', author=author, group=self.group)
+        commenter = User.objects.create_user(username='commenter')
+        Comment.objects.create(post=post, author=commenter, text='привет')
+        url = reverse('posts:post_detail', args=[post.pk])
+        api_urls = (
+            reverse('api:post_detail', args=[post.pk]),
+            reverse('api:comments', args=[post.pk]),
+        )
 
+        def etags():
+            return [self.guest_client.get(page)['ETag']
+                    for page in (url, *api_urls)]
 
-class PaginatorViewsTest(TestCase):
+        def rename(user, username, **fields):
+            user.username = username
+            for name, value in fields.items():
+                setattr(user, name, value)
+            user.save()
+
+        old = etags()
+        rename(author, 'writer', first_name='Лев', last_name='Толстой')
+        self.assertContains(self.guest_client.get(url), 'Лев Толстой')
+        self.assertContains(self.guest_client.get(api_urls[0]), 'writer')
+        new = etags()
+        self.assertNotEqual(new[:2], old[:2])
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.save()
+        self.assertContains(self.guest_client.get(url), 'Новое название')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=new[0])
+        self.assertEqual(response.status_code, 200)
+        rename(commenter, 'critic')
+        self.assertContains(self.guest_client.get(url), 'critic')
+        self.assertContains(self.guest_client.get(api_urls[1]), 'critic')
+        response = self.guest_client.get(
+            api_urls[1], HTTP_IF_NONE_MATCH=new[2])
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(COMMENTS_LIM=3)
+class CommentsViewTest(QueryAuditMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='commentator')
+        cls.post = Post.objects.create(text='пост', author=cls.user)
+        cls.short_post = Post.objects.create(text='тихий', author=cls.user)
+        authors = [
+            User.objects.create_user(username=f'reader{i}') for i in range(5)
+        ]
+        Comment.objects.bulk_create(
+            Comment(post=cls.post, author=author, text=f'Комментарий {i}')
+            for i, author in enumerate(authors)
+        )
+        Comment.objects.create(
+            post=cls.short_post, author=cls.user, text='Один')
+
+    def setUp(self):
+        cache.clear()
+
+    def texts(self, response):
+        return [comment.text for comment in response.context['comments']]
+
+    def test_comments_paginated(self):
+        """Комментарии отдаются порциями, следующая — фрагментом."""
+        response = self.client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        self.assertEqual(
+            self.texts(response), [f'Комментарий {i}' for i in range(3)])
+        more_url = reverse('posts:post_comments', args=[self.post.pk])
+        self.assertContains(response, more_url)
+        response = self.client.get(
+            more_url, {'after': response.context['comments'].next_cursor})
+        self.assertEqual(
+            self.texts(response), ['Комментарий 3', 'Комментарий 4'])
+        self.assertNotContains(response, more_url)
+
+    def test_comment_authors_joined(self):
+        """Число запросов не зависит от числа комментариев."""
+        counts = []
+        for post in (self.short_post, self.post):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('posts:post_detail', args=[post.pk]))
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class PaginatorViewsTest(QueryAuditMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -198,8 +487,47 @@ class PaginatorViewsTest(TestCase):
                     self.assertEqual(
                         len(response.context.get('page_obj')), count)
 
+    def test_paginator_cursors(self):
+        """Курсоры after/before ведут на соседние страницы."""
+        url = reverse('posts:index')
+        first_page = self.authorized_client.get(url).context['page_obj']
+        self.assertFalse(first_page.has_previous())
+        second_page = self.authorized_client.get(
+            url, {'after': first_page.next_cursor}).context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(set(first_page).isdisjoint(second_page))
+        back_page = self.authorized_client.get(
+            url, {'before': second_page.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back_page), list(first_page))
+
+    def test_paginator_bad_input(self):
+        """Испорченный курсор и номер за концом ленты не ломают её,
+        а номер больше PAGINATOR_MAX_PAGE даёт 404."""
+        url = reverse('posts:index')
+        response = self.authorized_client.get(url, {'after': 'garbage'})
+        self.assertEqual(len(response.context['page_obj']), 10)
+        response = self.authorized_client.get(
+            url, {'page': settings.PAGINATOR_MAX_PAGE})
+        page_obj = response.context['page_obj']
+        self.assertFalse(page_obj.has_next())
+        self.assertIn(Post.objects.order_by('pub_date', 'pk')[0], page_obj)
+        for page in (settings.PAGINATOR_MAX_PAGE + 1, 10 ** 9):
+            with self.subTest(page=page):
+                response = self.authorized_client.get(url, {'page': page})
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    def test_paginator_skips_count(self):
+        """Страница ленты строится без COUNT(*)."""
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(reverse('posts:index'), {'page': 2})
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries.captured_queries
+        ))
 
-class FollowViewTest(TestCase):
+
+class FollowViewTest(QueryAuditMixin, TestCase):
     @classmethod
     def setUpClass(cls):
         super().setUpClass()
@@ -263,6 +591,116 @@ class FollowViewTest(TestCase):
         response = self.new_client.get(
             reverse('posts:follow_index'))
         self.assertNotIn(self.post, response.context['page_obj'])
+
+    def test_timeline_fan_out(self):
+        """Новый пост автора попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.follower, author=self.user)
+        self.author_client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'})
+        new_post = Post.objects.get(text='Новый пост')
+        self.assertTrue(Timeline.objects.filter(
+            user=self.follower, post=new_post).exists())
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            list(response.context['page_obj']), [new_post, self.post])
+
+    @override_settings(TIMELINE_LENGTH=3)
+    def test_timeline_fan_out_trims(self):
+        """Раскладка оставляет в ленте только TIMELINE_LENGTH постов."""
+        Follow.objects.create(user=self.follower, author=self.user)
+        other = User.objects.create(username='other_follower')
+        Follow.objects.create(user=other, author=self.user)
+        posts = [
+            Post.objects.create(text=f'пост {number}', author=self.user)
+            for number in range(5)
+        ]
+        for user in (self.follower, other):
+            with self.subTest(user=user):
+                self.assertEqual(
+                    list(Timeline.objects.filter(user=user).values_list(
+                        'post', flat=True)),
+                    [post.pk for post in posts[:1:-1]],
+                )
+
+    @override_settings(TIMELINE_LENGTH=3, POSTS_LIM=2)
+    def test_timeline_history_past_trim(self):
+        """Страницы старше обрезанной ленты читаются из подписок."""
+        Follow.objects.create(user=self.follower, author=self.user)
+        posts = [
+            Post.objects.create(text=f'пост {number}', author=self.user)
+            for number in range(5)
+        ]
+        expected = posts[::-1] + [self.post]
+        self.assertEqual(Timeline.objects.filter(
+            user=self.follower).count(), 3)
+        url = reverse('posts:follow_index')
+        pages, params = [], {}
+        while True:
+            page_obj = self.follower_client.get(
+                url, params).context['page_obj']
+            pages.append(page_obj)
+            if not page_obj.has_next():
+                break
+            params = {'after': page_obj.next_cursor}
+        self.assertEqual(
+            [post for page_obj in pages for post in page_obj], expected)
+        previous = self.follower_client.get(
+            url, {'before': pages[-1].previous_cursor}).context['page_obj']
+        self.assertEqual(list(previous), expected[2:4])
+        numbered = self.follower_client.get(
+            url, {'page': 3}).context['page_obj']
+        self.assertEqual(list(numbered), expected[4:])
+
+    def test_timeline_unfollow_prunes(self):
+        """Отписка убирает посты автора из ленты."""
+        self.follower_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.user}))
+        self.assertTrue(Timeline.objects.filter(user=self.follower).exists())
+        self.follower_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user}))
+        self.assertFalse(Timeline.objects.filter(user=self.follower).exists())
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_pull_authors(self):
+        """Посты популярного автора подмешиваются при чтении."""
+        Follow.objects.create(user=self.follower, author=self.user)
+        cache.clear()
+        new_post = Post.objects.create(text='Популярный', author=self.user)
+        self.assertFalse(Timeline.objects.filter(post=new_post).exists())
+        response = self.follower_client.get(reverse('posts:follow_index'))
+        self.assertIn(new_post, response.context['page_obj'])
+
+    @override_settings(FOLLOW_FEED='heads')
+    def test_heads_merge_feed(self):
+        """Лента из голов авторов совпадает с лентой из базы."""
+        other = User.objects.create(username='other')
+        Follow.objects.create(user=self.follower, author=self.user)
+        Follow.objects.create(user=self.follower, author=other)
+        for i in range(12):
+            Post.objects.create(
+                text=f'пост {i}', author=(self.user, other)[i % 2])
+        expected = list(Post.objects.filter(
+            author__following__user=self.follower
+        ).order_by('-pub_date', '-pk'))
+        url = reverse('posts:follow_index')
+        for head_length, merged in ((50, True), (3, False)):
+            with self.subTest(head_length=head_length), override_settings(
+                    FEED_HEAD_LENGTH=head_length):
+                cache.clear()
+                with CaptureQueriesContext(connection) as queries:
+                    first_page = self.follower_client.get(
+                        url).context['page_obj']
+                joined = any(
+                    'JOIN "posts_follow"' in query['sql']
+                    for query in queries.captured_queries
+                )
+                self.assertEqual(joined, not merged)
+                second_page = self.follower_client.get(
+                    url, {'after': first_page.next_cursor}
+                ).context['page_obj']
+                self.assertEqual(
+                    list(first_page) + list(second_page), expected)
+
         #follow = Follow.objects.last()
         #self.assertNotEqual(self.follower, follow.user)
         #self.assertNotEqual(self.user, follow.author)
@@ -0,0 +1,240 @@
+"""Фоновая подготовка миниатюр постов.
+
+Размеры из ``settings.POST_THUMBNAILS`` нарезаются пулом потоков после
+коммита поста с картинкой. Шаблоны только спрашивают хранилище ключей
+sorl, готова ли миниатюра, и никогда не открывают изображение сами:
+пока вариант не готов, выводится оригинал с явными размерами. Для
+страницы постов ``prefetch`` находит все миниатюры одним ``get_many``
+по кэшу и одним запросом к базе.
+
+Кроме самой миниатюры нарезаются её копии нескольких ширин в WebP и
+JPEG для ``srcset``.
+"""
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from PIL import features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE, KVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+from sorl.thumbnail.parsers import parse_geometry
+
+from . import caching
+from .signals import post_scopes
+
+logger = logging.getLogger(__name__)
+
+Preview = namedtuple('Preview', 'url width height ready srcsets')
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def thumbnail_options(source, options):
+    """Опции так, как их дополняет ``ThumbnailBackend.get_thumbnail``."""
+    backend = default.backend
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def responsive_formats():
+    """Форматы вариантов для ``srcset``, которые умеет этот Pillow."""
+    return [
+        fmt for fmt in settings.POST_IMAGE_FORMATS
+        if fmt != 'WEBP' or features.check('webp')
+    ]
+
+
+def variants(size):
+    """Варианты размера: ``(ключ, геометрия, опции)``.
+
+    Первый, с ключом None, — сама миниатюра; остальные — её копии
+    шириной из ``settings.POST_IMAGE_WIDTHS`` в каждом формате, ключ
+    у них ``(формат, ширина)``.
+    """
+    geometry, options = settings.POST_THUMBNAILS[size]
+    width, height = parse_geometry(geometry)
+    result = [(None, geometry, options)]
+    for fmt in responsive_formats():
+        for variant_width in settings.POST_IMAGE_WIDTHS:
+            variant_geometry = str(variant_width)
+            if height:
+                variant_geometry += 'x%d' % round(
+                    variant_width * height / width)
+            result.append((
+                (fmt, variant_width), variant_geometry,
+                dict(options, format=fmt,
+                     quality=settings.POST_IMAGE_QUALITY),
+            ))
+    return result
+
+
+def thumbnail_file(name, geometry, options):
+    """Ещё не проверенный ``ImageFile`` миниатюры."""
+    source = ImageFile(name)
+    filename = default.backend._get_thumbnail_filename(
+        source, geometry, thumbnail_options(source, options))
+    return ImageFile(filename, default.storage)
+
+
+def lookup(name, size):
+    """Готовая миниатюра из хранилища ключей или None; без Pillow."""
+    _, geometry, options = variants(size)[0]
+    return default.kvstore.get(thumbnail_file(name, geometry, options))
+
+
+def lookup_many(names, size):
+    """Готовые варианты ``{имя оригинала: {ключ варианта: ImageFile}}``.
+
+    Повторяет ``_get_raw`` хранилища cached_db, но пакетно: один
+    ``get_many`` по кэшу и один запрос к базе на все промахи, которые
+    затем кладутся в кэш, включая отметки об отсутствии.
+    """
+    kvstore = default.kvstore
+    keys = {
+        add_prefix(thumbnail_file(name, geometry, options).key): (name, key)
+        for name in names for key, geometry, options in variants(size)
+    }
+    if isinstance(kvstore, KVStore):
+        found = kvstore.cache.get_many(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            stored = dict(KVStoreModel.objects.filter(
+                key__in=missing).values_list('key', 'value'))
+            fetched = {key: stored.get(key, EMPTY_VALUE) for key in missing}
+            kvstore.cache.set_many(
+                fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+            found.update(fetched)
+    else:
+        found = {key: kvstore._get_raw(key) for key in keys}
+    images = {}
+    for key, value in found.items():
+        if value is not None and value != EMPTY_VALUE:
+            name, variant = keys[key]
+            images.setdefault(name, {})[variant] = deserialize_image_file(
+                value)
+    return images
+
+
+def placeholder_size(size):
+    geometry, _ = settings.POST_THUMBNAILS[size]
+    return parse_geometry(geometry)
+
+
+def srcsets(images):
+    """``[(MIME-тип, srcset)]`` из готовых вариантов, форматы по порядку."""
+    result = []
+    for fmt in responsive_formats():
+        widths = sorted(
+            (variant[1], image) for variant, image in images.items()
+            if variant is not None and variant[0] == fmt
+        )
+        if widths:
+            result.append((
+                'image/' + fmt.lower(),
+                ', '.join(f'{image.url} {width}w' for width, image in widths),
+            ))
+    return result
+
+
+def preview(post, size, images):
+    """Что показать вместо картинки поста: миниатюру или заглушку.
+
+    ``images`` — готовые варианты из ``lookup_many``. Без самой
+    миниатюры выводится оригинал в её размерах. Нарезку при чтении не
+    заказываем: её ставит в очередь сохранение поста, а старые посты
+    догоняет команда ``generate_thumbnails``.
+    """
+    ready = len(images) == len(variants(size))
+    image = images.get(None)
+    if image:
+        return Preview(
+            image.url, image.width, image.height, ready, srcsets(images))
+    width, height = placeholder_size(size)
+    return Preview(post.image.url, width, height, ready, [])
+
+
+def prefetch(posts, size='card'):
+    """Найти миниатюры всех постов страницы разом.
+
+    Результат кладётся в ``post.previews[size]``, откуда его берёт тег
+    ``post_thumbnail``.
+    """
+    posts = [post for post in posts if post.image]
+    images = lookup_many({post.image.name for post in posts}, size)
+    for post in posts:
+        if not hasattr(post, 'previews'):
+            post.previews = {}
+        post.previews[size] = preview(
+            post, size, images.get(post.image.name, {}))
+
+
+def generate(name, scopes=()):
+    """Нарезать все размеры картинки и сбросить кэш её страниц."""
+    try:
+        for size in settings.POST_THUMBNAILS:
+            for _, geometry, options in variants(size):
+                get_thumbnail(name, geometry, **options)
+        caching.bump(*scopes)
+    except Exception:
+        logger.exception('Не удалось нарезать миниатюры %s', name)
+    finally:
+        with _lock:
+            _pending.discard(name)
+        close_old_connections()
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+    return _executor
+
+
+def enqueue(name, scopes=()):
+    """Поставить нарезку в очередь, если она ещё не запланирована.
+
+    При ``THUMBNAIL_WORKERS = 0`` нарезка выполняется сразу. Так же и
+    на базе SQLite в памяти: её блокировки таблиц не ждут, а сразу
+    падают, поэтому писать в неё из второго потока нельзя.
+    """
+    if not name:
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    if not settings.THUMBNAIL_WORKERS or connection.is_in_memory_db():
+        generate(name, scopes)
+        return
+    executor().submit(generate, name, tuple(scopes))
+
+
+def schedule(post):
+    """Нарезать миниатюры поста после коммита его сохранения."""
+    if not post.image:
+        return
+    scopes = post_scopes(post)
+    name = post.image.name
+    transaction.on_commit(lambda: enqueue(name, scopes))
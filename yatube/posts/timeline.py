@@ -0,0 +1,155 @@
+"""Лента подписок, материализованная при записи (fan-out on write).
+
+Каждый новый пост раскладывается по таблице ``Timeline`` всем
+подписчикам автора, поэтому ``/follow/`` читается одним диапазоном
+индекса ``(user, pub_date)``. Авторы, у которых подписчиков не меньше
+``settings.TIMELINE_FANOUT_LIMIT``, не раскладываются: их посты
+подмешиваются в ленту при чтении (pull). Если автор опустился ниже
+порога, старые посты попадут в ленты после ``rebuild_timelines``.
+Лента каждого подписчика обрезается до ``settings.TIMELINE_LENGTH``
+последних записей прямо при раскладке; страницы старше самой старой
+записи ленты читаются из ``history`` — обычного запроса по подпискам.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+
+from .models import Follow, Post, Timeline
+
+PULL_AUTHORS_KEY = 'timeline:pull_authors'
+
+
+def pull_authors():
+    """Множество id авторов, чьи посты читаются в pull-режиме."""
+    authors = cache.get(PULL_AUTHORS_KEY)
+    if authors is None:
+        authors = set(
+            Follow.objects.values('author')
+            .annotate(followers=Count('pk'))
+            .filter(followers__gte=settings.TIMELINE_FANOUT_LIMIT)
+            .values_list('author', flat=True)
+        )
+        cache.set(
+            PULL_AUTHORS_KEY, authors, settings.TIMELINE_PULL_CACHE_TIMEOUT
+        )
+    return authors
+
+
+def fan_out(post):
+    """Разложить новый пост по лентам подписчиков автора."""
+    if post.author_id in pull_authors():
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user', flat=True)
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(followers)
+
+
+def trim(user_ids):
+    """Удалить записи лент старше ``TIMELINE_LENGTH``-й по новизне.
+
+    Записи с той же датой, что у последней оставленной, сохраняются.
+    """
+    length = settings.TIMELINE_LENGTH
+    cutoff = Timeline.objects.filter(user=OuterRef('user')).order_by(
+        '-pub_date', '-post_id').values('pub_date')[length - 1:length]
+    Timeline.objects.filter(
+        user_id__in=user_ids, pub_date__lt=Subquery(cutoff)).delete()
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту последние посты автора после подписки."""
+    if author_id in pull_authors():
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-pk').values_list('pk', 'pub_date')
+    Timeline.objects.bulk_create(
+        (Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts[:settings.TIMELINE_LENGTH]),
+        batch_size=settings.TIMELINE_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    """Убрать из ленты посты автора после отписки."""
+    Timeline.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild(user_ids):
+    """Пересобрать ленты заданных пользователей с нуля."""
+    pulled = pull_authors()
+    for user_id in user_ids:
+        posts = Post.objects.filter(
+            author__following__user_id=user_id
+        ).exclude(author_id__in=pulled).order_by(
+            '-pub_date', '-pk').values_list('pk', 'pub_date')
+        with transaction.atomic():
+            Timeline.objects.filter(user_id=user_id).delete()
+            Timeline.objects.bulk_create(
+                (Timeline(user_id=user_id, post_id=post_id, pub_date=pub_date)
+                 for post_id, pub_date in posts[:settings.TIMELINE_LENGTH]),
+                batch_size=settings.TIMELINE_BATCH_SIZE,
+            )
+
+
+def feed(user):
+    """Queryset ленты подписок и порядок для CursorPaginator.
+
+    В обычном случае это записи ``Timeline`` пользователя; если он
+    подписан на pull-авторов, их посты объединяются с лентой.
+    """
+    pulled = pull_authors()
+    followed_pulled = list(Follow.objects.filter(
+        user=user, author_id__in=pulled).values_list(
+        'author', flat=True)) if pulled else []
+    if not followed_pulled:
+        entries = Timeline.objects.filter(user=user).select_related(
+            'post__author', 'post__group')
+        return entries, ('-pub_date', '-post_id')
+    posts = Post.objects.filter(
+        Q(pk__in=Timeline.objects.filter(user=user).values('post'))
+        | Q(author_id__in=followed_pulled)
+    ).select_related('author', 'group')
+    return posts, ('-pub_date', '-pk')
+
+
+def history(user):
+    """Queryset всех постов из подписок и порядок для CursorPaginator.
+
+    Лента — начало этой выборки, поэтому курсоры и номера страниц
+    у них общие.
+    """
+    posts = Post.objects.filter(
+        author__following__user=user).select_related('author', 'group')
+    return posts, ('-pub_date', '-pk')
+
+
+def oldest(user):
+    """Ключ ``(дата, id поста)`` самой старой записи ленты или None."""
+    return Timeline.objects.filter(user=user).order_by(
+        'pub_date', 'post_id').values_list('pub_date', 'post_id').first()
+
+
+def exhausted(user, page):
+    """Страница дошла до конца ленты, и дальше её продолжает
+    ``history``: ``trim`` мог отрезать более старые посты."""
+    if not page.has_next():
+        return True
+    end = oldest(user)
+    return end is None or page.paginator.key_of(page[-1]) <= end
+
+
+def posts_of(page):
+    """Посты страницы ленты, какой бы queryset её ни построил."""
+    return [
+        entry.post if isinstance(entry, Timeline) else entry
+        for entry in page
+    ]
@@ -0,0 +1,63 @@
+"""Нормализация загружаемых картинок постов.
+
+Оригинал поворачивается по EXIF, лишается метаданных и ужимается до
+``settings.POST_IMAGE_MAX_SIZE`` по большей стороне, сохраняя имя и
+формат файла; от MPO остаётся первый кадр в JPEG. Анимированные и прочие
+форматы хранятся как есть.
+"""
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import models
+from PIL import Image, ImageOps
+
+NORMALIZED_FORMATS = ('JPEG', 'PNG', 'WEBP')
+
+
+def save_options(image, fmt):
+    options = {'optimize': True}
+    if fmt in ('JPEG', 'WEBP'):
+        options['quality'] = settings.POST_IMAGE_QUALITY
+    if fmt == 'JPEG':
+        options['progressive'] = True
+    icc_profile = image.info.get('icc_profile')
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    return options
+
+
+def normalize(upload):
+    """Загруженный файл с нормализованной картинкой или он же сам."""
+    upload.seek(0)
+    image = Image.open(upload)
+    fmt = image.format
+    if fmt == 'MPO':
+        # Снимки телефонов: JPEG с дополнительными кадрами, берём первый.
+        fmt = 'JPEG'
+    elif (fmt not in NORMALIZED_FORMATS
+          or getattr(image, 'is_animated', False)):
+        upload.seek(0)
+        return upload
+    image = ImageOps.exif_transpose(image)
+    limit = settings.POST_IMAGE_MAX_SIZE
+    image.thumbnail((limit, limit), Image.LANCZOS)
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, fmt, **save_options(image, fmt))
+    return SimpleUploadedFile(
+        upload.name, buffer.getvalue(), Image.MIME.get(fmt))
+
+
+def store(instance):
+    """Записать новые файлы объекта в хранилище до транзакции.
+
+    Иначе их пишет ``save()`` внутри неё, и каждый повтор при занятой
+    базе оставлял бы в хранилище ещё одну копию.
+    """
+    for field in instance._meta.concrete_fields:
+        if isinstance(field, models.FileField):
+            file = getattr(instance, field.attname)
+            if file and not file._committed:
+                file.save(file.name, file.file, save=False)
@@ -1,31 +1,49 @@
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
+from core.nplusone import query_budget
+from core.paginator import CursorPaginator
+from core.transactions import busy_unavailable, write_transaction
 from posts.models import Follow, Group, Post, User
 
+from . import counters, heads, thumbnails, timeline, uploads
+from .caching import cached_page, conditional_page
 from .forms import CommentForm, PostForm
 
+# Синхронная нарезка миниатюр (без пула потоков) пишет в хранилище sorl
+# в том же запросе; это фоновая работа, а не запросы представления.
+THUMBNAIL_JOB = (r'"thumbnail_kvstore"',)
 
-def paginator(request, post_list):
-    paginator = Paginator(post_list, settings.POSTS_LIM)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+
+def paginator(request, post_list, per_page=None, **kwargs):
+    paginator = CursorPaginator(
+        post_list, per_page or settings.POSTS_LIM, **kwargs)
+    return paginator.get_page(
+        request.GET.get('page'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
 
 
+@query_budget(6)
+@cached_page('global')
 def index(request):
     post_list = Post.objects.select_related('author', 'group')
     page_obj = paginator(request, post_list)
+    thumbnails.prefetch(page_obj)
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(6)
+@cached_page('group', kwarg='slug')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     post_list = group.posts.select_related('author')
     page_obj = paginator(request, post_list)
+    thumbnails.prefetch(page_obj)
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -33,51 +51,104 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(7)
+@cached_page('author', kwarg='username')
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('counters'), username=username)
     post_list = author.posts.select_related('group')
-    following = request.user.is_authenticated and (
-        request.user.follower.filter(author=author).exists()
-    )
-    page_obj = paginator(request, post_list)
+    page_obj = paginator(
+        request, post_list, count=counters.of(author).posts_count)
+    thumbnails.prefetch(page_obj)
     context = {
         'author': author,
         'page_obj': page_obj,
-        'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def post_related_scopes(post_id):
+    """Автор и группа поста: их имена и счётчики тоже на его странице."""
+    names = Post.objects.filter(pk=post_id).values_list(
+        'author__username', 'group__slug').first()
+    if names is None:
+        return []
+    username, slug = names
+    return [('author', username)] + ([('group', slug)] if slug else [])
+
+
+@query_budget(8)
+@cached_page('post', kwarg='post_id', related=post_related_scopes)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
-    form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'),
+        pk=post_id
+    )
     context = {
         'post': post,
-        'form': form,
-        'comments': comments,
+        'author_counters': counters.of(post.author),
+        'form': CommentForm(),
+        'comments': comments_page(request, post),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def comments_page(request, post):
+    """Порция комментариев поста от старых к новым по курсору ``after``."""
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        settings.COMMENTS_LIM,
+        ordering=('created', 'pk'),
+        count=post.comments_count,
+    )
+    return paginator.get_page(after=request.GET.get('after'))
+
+
+@query_budget(4)
+@cached_page('post', kwarg='post_id')
+def post_comments(request, post_id):
+    """HTML-фрагмент для кнопки «Показать ещё комментарии»."""
+    post = get_object_or_404(Post, pk=post_id)
+    context = {
+        'post': post,
+        'comments': comments_page(request, post),
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+@write_transaction
+def save_form(form):
+    """Сохранить проверенную форму: блокировка записи только на INSERT
+    или UPDATE, картинка к этому времени уже обработана и записана."""
+    instance = form.save(commit=False)
+    instance.save()
+    form.save_m2m()
+    return instance
+
+
+@query_budget(10, allow=THUMBNAIL_JOB)
 @login_required
+@busy_unavailable
 def post_create(request):
     form = PostForm(
         request.POST or None,
         files=request.FILES or None
     )
     if form.is_valid():
-        temp_form = form.save(commit=False)
-        temp_form.author = request.user
-        temp_form.save()
-        return redirect('posts:profile', temp_form.author)
+        form.instance.author = request.user
+        uploads.store(form.instance)
+        post = save_form(form)
+        thumbnails.schedule(post)
+        return redirect('posts:profile', post.author)
     context = {
         'form': form,
     }
     return render(request, 'posts/create_post.html', context)
 
 
+@query_budget(10, allow=THUMBNAIL_JOB)
 @login_required
+@busy_unavailable
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
@@ -88,7 +159,10 @@ def post_edit(request, post_id):
         instance=post
     )
     if form.is_valid():
-        form.save()
+        uploads.store(form.instance)
+        post = save_form(form)
+        if 'image' in form.changed_data:
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'form': form,
@@ -98,7 +172,9 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+@query_budget(7)
 @login_required
+@write_transaction(methods=('POST',))
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -110,18 +186,46 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+def follow_page(request, per_page=None):
+    """Страница ленты подписок текущего пользователя."""
+    per_page = per_page or settings.POSTS_LIM
+    if settings.FOLLOW_FEED == 'heads':
+        return heads.feed_page(request.user, per_page, request.GET)
+    post_list, ordering = timeline.feed(request.user)
+    page_obj = paginator(
+        request, post_list, per_page=per_page, ordering=ordering)
+    if timeline.exhausted(request.user, page_obj):
+        post_list, ordering = timeline.history(request.user)
+        page_obj = paginator(
+            request, post_list, per_page=per_page, ordering=ordering)
+    page_obj.object_list = timeline.posts_of(page_obj)
+    return page_obj
+
+
+def follow_scopes(request):
+    """Области ленты подписок: набор подписок и каждый автор из него."""
+    usernames = Follow.objects.filter(user=request.user).values_list(
+        'author__username', flat=True)
+    return [('follows', str(request.user.pk))] + [
+        ('author', username) for username in usernames
+    ]
+
+
+@query_budget(9)
 @login_required
+@conditional_page(follow_scopes)
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__user=request.user).select_related('author')
-    page_obj = paginator(request, post_list)
+    page_obj = follow_page(request)
+    thumbnails.prefetch(page_obj)
     context = {
         'page_obj': page_obj
     }
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(15)
 @login_required
+@write_transaction
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if request.user != author:
@@ -129,7 +233,9 @@ def profile_follow(request, username):
     return redirect('posts:profile', author)
 
 
+@query_budget(15)
 @login_required
+@write_transaction
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
@@ -4,7 +4,7 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.LocMemCache',
     }
 }
 
@@ -36,11 +36,17 @@ INSTALLED_APPS = [
     "users.apps.UsersConfig",
     "core.apps.CoreConfig",
     "about.apps.AboutConfig",
+    "api.apps.ApiConfig",
     'sorl.thumbnail',
     'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    "core.metrics.MetricsMiddleware",
+    "core.profiling.ProfilingMiddleware",
+    "core.slow_queries.SlowQueryMiddleware",
+    "core.nplusone.QueryAuditMiddleware",
+    "core.routers.ReplicaMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -79,10 +85,12 @@ WSGI_APPLICATION = "yatube.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "core.backends.sqlite3",
         "NAME": os.path.join(BASE_DIR, "db.sqlite3"),
+        "CONN_MAX_AGE": 60,
     }
 }
+DATABASE_ROUTERS = ['core.routers.ShardRouter', 'core.routers.ReplicaRouter']
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -124,5 +132,93 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 POSTS_LIM = 10
+COMMENTS_LIM = 50
+API_MAX_LIMIT = 100
+PAGE_CACHE_TIMEOUT = 60 * 10
+PAGINATOR_MAX_PAGE = 50
+# 'timeline' — материализованные ленты, 'heads' — слияние голов авторов.
+FOLLOW_FEED = 'timeline'
+FEED_HEAD_LENGTH = 50
+FEED_HEAD_TIMEOUT = 60 * 60 * 24
+TIMELINE_FANOUT_LIMIT = 5000
+TIMELINE_LENGTH = 1000
+TIMELINE_BATCH_SIZE = 500
+TIMELINE_PULL_CACHE_TIMEOUT = 60
+# Размеры миниатюр постов: имя -> (геометрия, опции sorl).
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+# Копии миниатюр этих ширин и форматов попадают в srcset.
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+POST_IMAGE_FORMATS = ('WEBP', 'JPEG')
+POST_IMAGE_QUALITY = 82
+# Большая сторона загруженного оригинала, px.
+POST_IMAGE_MAX_SIZE = 2560
+# 0 — нарезать миниатюры синхронно, без пула потоков.
+THUMBNAIL_WORKERS = 2
+# Метрики запросов по представлениям, отдаются на /metrics/.
+METRICS_ENABLED = True
+METRICS_ALLOWED_IPS = INTERNAL_IPS
+METRICS_LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+METRICS_QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Доля запросов под cProfile; заголовок X-Profile профилирует всегда.
+PROFILE_SAMPLE_RATE = 0
+PROFILE_TOKEN_MAX_AGE = 60 * 60
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+# Порог суммарного времени группы одинаковых запросов ответа, секунды;
+# None выключает журнал медленного SQL.
+SLOW_QUERY_THRESHOLD = 0.1
+# N+1 и бюджеты запросов: 'log', 'raise' или None.
+QUERY_AUDIT = 'log'
+QUERY_AUDIT_REPEAT = 3
+# Регулярные выражения отпечатков SQL, повтор которых допустим.
+QUERY_AUDIT_ALLOWLIST = []
+# PRAGMA для каждого нового соединения SQLite.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение — в КиБ: 64 МиБ страничного кэша.
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 5000,
+}
+# Проверять долгоживущие соединения перед каждым запросом.
+DB_HEALTH_CHECKS = True
+# Повторы пишущей транзакции при занятой базе и база задержки, секунды.
+WRITE_RETRIES = 5
+WRITE_RETRY_DELAY = 0.05
+# Алиасы DATABASES только для чтения; пусто — всё на default. Локальная
+# реплика — отдельный алиас с копией файла от manage.py sync_replica.
+DATABASE_REPLICAS = []
+# Сколько секунд после записи браузер читает с основной базы.
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_COOKIE = 'primary'
+# Приложения, которые всегда читаются с основной базы.
+REPLICA_EXCLUDED_APPS = ['sessions', 'thumbnail']
+# Алиасы DATABASES, по которым посты, комментарии и подписки раскладываются
+# по id автора; пусто — всё в default. Новые шарды: migrate --database,
+# затем manage.py rebalance_shards. Лента подписок — только FOLLOW_FEED
+# = 'heads'.
+SHARD_DATABASES = []
+# Модели, копии которых лежат на каждом шарде ради JOIN.
+SHARD_REPLICATED_MODELS = ['auth.User', 'posts.Group']
+# Сколько id процесс берёт у общей последовательности за раз.
+SHARD_ID_BLOCK = 100
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.slow_queries': {'handlers': ['console'], 'level': 'WARNING'},
+        'core.nplusone': {'handlers': ['console'], 'level': 'WARNING'},
+        'core.transactions': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
 TEXT_POSTS_LIM = 15
 LIM_LENGHT = 15